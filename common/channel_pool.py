@@ -0,0 +1,48 @@
+"""Round-robin pool of async gRPC channels."""
+import asyncio
+import itertools
+from typing import Sequence, Tuple
+
+import grpc
+
+
+class ChannelPool:
+    """Round-robin pool of async channels, each on its own TCP connection."""
+
+    def __init__(self, target: str, stub_class, n: int = 4, options: Sequence[Tuple] = ()):
+        """Open the pooled channels.
+
+        Args:
+            target: host:port of the service
+            stub_class: Generated stub class handed out by stub()
+            n: Number of channels (and TCP connections)
+            options: Channel options applied to every channel
+        """
+        self.stub_class = stub_class
+        # A distinct channel arg per channel stops gRPC sharing one subchannel
+        self.channels = [
+            grpc.aio.insecure_channel(
+                target, options=list(options) + [("grpc.channel_number", i)]
+            )
+            for i in range(n)
+        ]
+        self._counter = itertools.count()
+
+    def stub(self):
+        """Get a stub bound to the next channel in rotation."""
+        channel = self.channels[next(self._counter) % len(self.channels)]
+        return self.stub_class(channel)
+
+    async def wait_ready(self, timeout: float):
+        """Wait until every pooled channel is connected.
+
+        Raises:
+            asyncio.TimeoutError: If any channel is not READY within timeout
+        """
+        await asyncio.wait_for(
+            asyncio.gather(*(channel.channel_ready() for channel in self.channels)), timeout
+        )
+
+    async def close(self):
+        """Close all pooled channels."""
+        await asyncio.gather(*(channel.close() for channel in self.channels))
@@ -0,0 +1,56 @@
+"""Helpers for showing the end of a service's log output."""
+import threading
+from collections import deque
+from typing import Deque, List
+
+
+def tail_n(path, n: int = 20, block: int = 4096) -> List[str]:
+    """Return the last n lines of a file, reading backwards from the end.
+
+    Args:
+        path: Log file to read
+        n: Number of lines wanted
+        block: Bytes read per step back from the end
+
+    Returns:
+        Up to n decoded lines, or an empty list if the file cannot be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            pos = f.tell()
+            buf = b''
+            lines = []
+            while pos > 0 and len(lines) <= n:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+                lines = buf.splitlines()
+    except OSError:
+        return []
+    return [line.decode(errors='replace') for line in lines[-n:]]
+
+
+def print_tail(path, n: int = 20):
+    """Print the last n lines of a log file."""
+    for line in tail_n(path, n):
+        print(line)
+
+
+def follow(stream, maxlen: int = 100) -> Deque[str]:
+    """Keep the last maxlen lines of a live text stream in memory.
+
+    A daemon thread drains the stream (so a service writing to a pipe never
+    blocks on it) until it reaches EOF.
+
+    Args:
+        stream: Readable text stream, e.g. a piped service's stdout
+        maxlen: Number of most recent lines to keep
+
+    Returns:
+        The deque the lines are appended to
+    """
+    lines = deque(maxlen=maxlen)
+    threading.Thread(target=lines.extend, args=(stream,), daemon=True).start()
+    return lines
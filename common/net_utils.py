@@ -0,0 +1,36 @@
+"""Probes for local services: TCP ports and the Ollama HTTP API."""
+import json
+import socket
+import urllib.request
+from typing import Optional, Set
+
+OLLAMA_PORT = 11434
+OLLAMA_URL = f"http://127.0.0.1:{OLLAMA_PORT}"
+OLLAMA_TAGS_URL = f"{OLLAMA_URL}/api/tags"
+
+
+def port_open(port: int, host: str = '127.0.0.1', timeout: float = 0.1) -> bool:
+    """Cheap TCP probe: check whether something accepts connections on a port."""
+    try:
+        socket.create_connection((host, port), timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+
+
+def ollama_up(timeout: float = 0.5) -> bool:
+    """Check that Ollama's HTTP API answers, without spawning a client process."""
+    try:
+        with urllib.request.urlopen(OLLAMA_TAGS_URL, timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def ollama_models(timeout: float = 0.5) -> Optional[Set[str]]:
+    """Return the set of model names Ollama reports, or None if it is unreachable."""
+    try:
+        with urllib.request.urlopen(OLLAMA_TAGS_URL, timeout=timeout) as response:
+            return {model['name'] for model in json.load(response)['models']}
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,362 @@
+"""Process utilities for waiting on and stopping services."""
+import os
+import re
+import select
+import signal
+import stat
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+def runtime_dir(*parts: str) -> str:
+    """Return a private (0700, owned by us) per-user directory, creating it if needed.
+
+    Lives under $XDG_RUNTIME_DIR, or a per-uid directory in the temp dir when
+    that is unset. An existing directory is only used if it is a real
+    directory (not a symlink) owned by us with no group/other access.
+
+    Args:
+        parts: Subdirectories below the runtime directory, each checked the same way
+
+    Raises:
+        PermissionError: If the directory exists but is not private to us
+    """
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    path = os.path.join(base, 'alexa_w') if base else os.path.join(
+        tempfile.gettempdir(), f'alexa_w-{os.getuid()}'
+    )
+    dirs = [path]
+    for part in parts:
+        dirs.append(os.path.join(dirs[-1], part))
+    for path in dirs:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+        st = os.lstat(path)
+        if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid()
+                or st.st_mode & 0o077):
+            raise PermissionError(f"{path} is not a private directory owned by us")
+    return path
+
+
+def _registry_path(pid: int) -> str:
+    """Path of a pid's entry in the command-line registry.
+
+    Services forked by tests/zygote.py keep the zygote's own command line, so
+    the zygote records what each child is running there for find_by_name.
+    """
+    return os.path.join(runtime_dir('cmdlines'), str(pid))
+
+
+def _start_time(pid: int) -> Optional[bytes]:
+    """Read a process's start time (in clock ticks since boot) from /proc."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # Field 22; fields are counted from the state after the command name
+            return f.read().rpartition(b')')[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def register_cmdline(pid: int, cmdline: str):
+    """Record the command line a process is really running, for find_by_name.
+
+    The entry is tied to the process's start time, so a reused pid never
+    inherits it.
+    """
+    start = _start_time(pid)
+    if start is None:
+        return
+    path = _registry_path(pid)
+    unregister_cmdline(pid)  # A stale entry from a reused pid
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    with open(fd, 'wb') as f:
+        f.write(start + b'\n' + cmdline.encode())
+
+
+def unregister_cmdline(pid: int):
+    """Drop a process's registered command line."""
+    try:
+        os.unlink(_registry_path(pid))
+    except FileNotFoundError:
+        pass
+
+
+def _registered_cmdlines() -> Dict[int, str]:
+    """Load registered command lines, discarding entries for exited processes."""
+    registry = runtime_dir('cmdlines')
+    entries = os.listdir(registry)
+
+    cmdlines = {}
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            fd = os.open(os.path.join(registry, entry), os.O_RDONLY | os.O_NOFOLLOW)
+            with open(fd, 'rb') as f:
+                start, _, cmdline = f.read().partition(b'\n')
+        except OSError:
+            continue
+        if start == _start_time(pid):
+            cmdlines[pid] = cmdline.decode(errors='replace')
+        else:
+            unregister_cmdline(pid)  # Left behind by a zygote that died
+    return cmdlines
+
+
+def poll_until(predicate: Callable[[], bool], timeout: float, initial: float = 0.025,
+               factor: float = 1.5, cap: float = 0.5) -> bool:
+    """Poll predicate with exponential backoff until it is true or timeout expires.
+
+    Args:
+        predicate: Called until it returns a truthy value
+        timeout: Seconds to keep polling
+        initial: First delay between polls
+        factor: Growth of the delay after each poll
+        cap: Longest delay between polls
+
+    Returns:
+        True if predicate succeeded before the timeout
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(delay)
+        delay = min(cap, delay * factor)
+    return False
+
+
+def find_by_name(pattern: str) -> List[int]:
+    """Find processes whose command line matches a regex.
+
+    Args:
+        pattern: Regular expression searched for in each /proc/<pid>/cmdline,
+            and in the registered command line of zygote-forked services
+
+    Returns:
+        PIDs of matching processes, excluding the caller
+    """
+    regex = re.compile(pattern)
+    own_pid = os.getpid()
+    registered = _registered_cmdlines()
+    pids = []
+
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        if pid == own_pid:
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='replace')
+        except OSError:
+            continue  # Exited or not ours to read
+        if regex.search(cmdline) or (pid in registered and regex.search(registered[pid])):
+            pids.append(pid)
+
+    return pids
+
+
+def _alive(pid: int) -> bool:
+    """Check whether a process still exists (zombies count as gone)."""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # State follows the parenthesised command name
+            return f.read().rpartition(b')')[2].split()[0] != b'Z'
+    except (OSError, IndexError):
+        return False
+
+
+def wait_pid(pid: int, timeout: Optional[float]) -> bool:
+    """Wait for a process to exit, waking as soon as it does.
+
+    Uses a pidfd (Linux 5.3+), which becomes readable when the process exits,
+    so there is no waitpid/sleep polling. Works for any pid, not just children;
+    a child still has to be reaped by its parent afterwards.
+
+    Args:
+        pid: Process to wait for
+        timeout: Seconds to wait at most, or None to wait indefinitely
+
+    Returns:
+        True if the process has exited
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return True
+    except (AttributeError, OSError):
+        # No pidfd support; fall back to polling
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while _alive(pid):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    try:
+        readable, _, _ = select.select([fd], [], [], timeout)
+    finally:
+        os.close(fd)
+    return bool(readable)
+
+
+def kill_by_name(pattern: str, grace: float = 0.5, poll_interval: float = 0.05) -> List[int]:
+    """SIGTERM processes matching a command-line regex, SIGKILLing any left after grace.
+
+    Args:
+        pattern: Regular expression searched for in each process command line
+        grace: Seconds to wait for a clean exit before SIGKILL
+        poll_interval: Time between checks for exited processes
+
+    Returns:
+        PIDs that were signalled
+    """
+    signalled = []
+    for pid in find_by_name(pattern):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            signalled.append(pid)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    deadline = time.monotonic() + grace
+    remaining = signalled
+    while remaining and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        remaining = [pid for pid in remaining if _alive(pid)]
+
+    for pid in remaining:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    # SIGKILL is not instant; wait (up to 2s, even with no grace) for the
+    # kernel to tear them down so their ports and VRAM are free on return
+    if remaining:
+        poll_until(lambda: not any(map(_alive, remaining)), timeout=2.0, initial=poll_interval)
+
+    return signalled
+
+
+def _group_alive(pgid: int) -> bool:
+    """Check whether any process is left in a process group."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # A member we may not signal still counts
+    return True
+
+
+def _leader_exits(processes: Dict[str, subprocess.Popen], timeout: float) -> Iterator[str]:
+    """Yield each process's name as it exits, in exit order, until all have or timeout passes.
+
+    Waits on one pidfd per process in a single select(), polling instead
+    where pidfds are unsupported.
+    """
+    pending = dict(processes)
+    deadline = time.monotonic() + timeout
+    fds = {}
+    try:
+        for name, process in pending.items():
+            fds[os.pidfd_open(process.pid)] = name
+    except (AttributeError, OSError):
+        for fd in fds:
+            os.close(fd)
+        fds = None
+
+    try:
+        while pending:
+            remaining = max(0.0, deadline - time.monotonic())
+            if fds is not None:
+                ready, _, _ = select.select(list(fds), [], [], remaining)
+                exited = []
+                for fd in ready:
+                    os.close(fd)
+                    exited.append(fds.pop(fd))
+            else:
+                exited = [name for name, process in pending.items() if process.poll() is not None]
+                if not exited and remaining:
+                    time.sleep(min(0.05, remaining))
+            for name in exited:
+                del pending[name]
+                yield name
+            if not exited and not remaining:
+                return
+    finally:
+        for fd in fds or ():
+            os.close(fd)
+
+
+def stop_process_groups(processes: Dict[str, subprocess.Popen], grace: float = 2.0,
+                        report: Optional[Callable[[str, str], None]] = None) -> Dict[str, str]:
+    """SIGTERM every service's process group at once, SIGKILLing what is left after grace.
+
+    Each process must lead its own group (start_new_session=True), so any
+    workers it forked are stopped along with it. A group is SIGKILLed if its
+    leader is still up after grace, or if the leader exited but left members
+    behind (a worker that ignores SIGTERM).
+
+    Args:
+        processes: Service processes keyed by name; None entries and processes
+            that already exited are skipped
+        grace: Seconds to wait for a clean exit before SIGKILL
+        report: Called as report(name, outcome) as soon as each group's
+            outcome is known, so callers can show services as they go
+
+    Returns:
+        Outcome per signalled name: 'stopped', 'killed', or 'alive' if even
+        SIGKILL did not clear the group within 2s
+    """
+    running = {name: p for name, p in processes.items() if p is not None and p.poll() is None}
+    for process in running.values():
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    outcomes = {}
+
+    def settle(name, outcome):
+        outcomes[name] = outcome
+        if report is not None:
+            report(name, outcome)
+
+    for name in _leader_exits(running, grace):
+        process = running[name]
+        process.poll()  # Reap the leader so only the rest of its group counts
+        if not _group_alive(process.pid):
+            settle(name, 'stopped')
+
+    # Leaders still up, and groups whose leader left members behind; an
+    # unreaped leader keeps its pid (and group) valid until it is reaped
+    stragglers = {name: p for name, p in running.items() if name not in outcomes}
+    for process in stragglers.values():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + 2.0
+    while stragglers:
+        for name, process in list(stragglers.items()):
+            if process.poll() is not None and not _group_alive(process.pid):
+                del stragglers[name]
+                settle(name, 'killed')
+        if not stragglers or time.monotonic() >= deadline:
+            break
+        time.sleep(0.02)
+    for name in stragglers:
+        settle(name, 'alive')
+
+    return outcomes
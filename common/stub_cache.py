@@ -0,0 +1,46 @@
+"""Cache of sync gRPC stubs and health clients for local service ports."""
+from typing import Dict, Sequence, Tuple
+
+import grpc
+
+from common.health_client import HealthClient
+
+
+class StubCache:
+    """One channel per local port, shared by every stub handed out for it."""
+
+    def __init__(self, options: Sequence[Tuple] = ()):
+        """
+        Args:
+            options: Channel options applied to every channel
+        """
+        self.options = list(options)
+        self._channels: Dict[int, grpc.Channel] = {}
+        self._stubs = {}
+        self._health_clients: Dict[int, HealthClient] = {}
+
+    def stub(self, port: int, stub_cls):
+        """Get a cached stub for a local service port, sharing one channel per port."""
+        key = (port, stub_cls)
+        if key not in self._stubs:
+            if port not in self._channels:
+                self._channels[port] = grpc.insecure_channel(f'127.0.0.1:{port}', options=self.options)
+            self._stubs[key] = stub_cls(self._channels[port])
+        return self._stubs[key]
+
+    def health(self, port: int) -> HealthClient:
+        """Get the cached health client for a service port."""
+        if port not in self._health_clients:
+            self._health_clients[port] = HealthClient(port=port)
+        return self._health_clients[port]
+
+    def close(self):
+        """Close all shared channels and health clients."""
+        for channel in self._channels.values():
+            channel.close()
+        self._channels.clear()
+        self._stubs.clear()
+
+        for client in self._health_clients.values():
+            client.close()
+        self._health_clients.clear()
@@ -1,8 +1,10 @@
 """VRAM monitoring and logging utility."""
 import time
+import atexit
 import logging
+import subprocess
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 import json
 import threading
@@ -11,8 +13,67 @@ try:
     import pynvml as nvml
     NVML_AVAILABLE = True
 except ImportError:
+    nvml = None
     NVML_AVAILABLE = False
 
+# Handle for GPU 0, bound on first use so importing this module never touches NVML
+_nvml_handle = None
+_nvml_probed = False
+_nvml_lock = threading.Lock()
+
+
+def get_nvml_handle():
+    """Get the NVML handle for GPU 0, initializing NVML on the first call.
+    
+    Returns:
+        Device handle, or None if NVML or a GPU is unavailable
+    """
+    global _nvml_handle, _nvml_probed
+    with _nvml_lock:
+        if not _nvml_probed:
+            _nvml_probed = True
+            if NVML_AVAILABLE:
+                try:
+                    nvml.nvmlInit()
+                    _nvml_handle = nvml.nvmlDeviceGetHandleByIndex(0)
+                    atexit.register(nvml.nvmlShutdown)
+                except nvml.NVMLError:
+                    _nvml_handle = None
+    return _nvml_handle
+
+
+def read_vram_mb() -> Optional[Tuple[int, int]]:
+    """Read GPU 0 memory as (used, free) MB via NVML, falling back to nvidia-smi.
+    
+    Returns:
+        (used, free) tuple, or None if neither source is available
+    """
+    handle = get_nvml_handle()
+    if handle is not None:
+        try:
+            info = nvml.nvmlDeviceGetMemoryInfo(handle)
+            return info.used >> 20, info.free >> 20
+        except nvml.NVMLError:
+            pass
+    
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.used,memory.free", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True
+        )
+    except OSError:
+        return None
+    lines = result.stdout.splitlines()
+    # No GPU visible (or a driver error) can still exit 0, with no usable line
+    if result.returncode != 0 or not lines:
+        return None
+    try:
+        used, free = lines[0].split(',')
+        return int(used), int(free)
+    except ValueError:
+        return None
+
 
 class VRAMLogger:
     """Monitors and logs VRAM usage to memory.log."""
@@ -117,14 +178,16 @@ class VRAMLogger:
             self.memory_logger.error(f"Error getting VRAM info: {e}")
             return None
             
-    def log_vram_status(self, event: str = None, service: str = None):
+    def log_vram_status(self, event: str = None, service: str = None, vram_info: Optional[Dict] = None):
         """Log current VRAM status with optional event description.
         
         Args:
             event: Optional event description (e.g., "Service started")
             service: Optional service name
+            vram_info: Snapshot to log instead of taking a fresh reading
         """
-        vram_info = self.get_vram_info()
+        if vram_info is None:
+            vram_info = self.get_vram_info()
         if not vram_info:
             return
             
@@ -143,7 +206,7 @@ class VRAMLogger:
         ])
         
         # Add process count if available
-        if vram_info['processes']:
+        if vram_info.get('processes'):
             msg_parts.append(f"GPU Processes: {len(vram_info['processes'])}")
             
         message = " | ".join(msg_parts)
@@ -0,0 +1,260 @@
+"""Shared pytest fixtures for tests that need a running LLM stack."""
+import sys
+import time
+import threading
+import subprocess
+from pathlib import Path
+
+import grpc
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+VENV_PY = ROOT / '.venv/bin/python'
+LOGGER_SCRIPT = ROOT / 'services/logger/logger_service.py'
+LLM_SCRIPT = ROOT / 'services/llm/llm_service.py'
+
+# Add parent directory to path
+sys.path.insert(0, str(ROOT))
+
+# Load the generated proto modules once for the whole session, before any
+# test module is collected; later imports are sys.modules lookups
+from proto import services_pb2, services_pb2_grpc
+from common.health_client import HealthClient
+from common.proc_utils import kill_by_name, poll_until
+from common.vram_logger import read_vram_mb
+from common.net_utils import ollama_up
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+# Command lines of stale services; Ollama is left running so its models stay loaded
+_SERVICES_RE = r"llm_service\.py|logger_service\.py"
+
+# Keep the LLM connection warm between queries and open a wide flow-control
+# window up front so streamed tokens are not throttled while it ramps up
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_time_between_pings_ms', 10000),
+    ('grpc.http2.lookahead_bytes', 4 * 1024 * 1024),
+    # Retry the connect quickly while the service is still starting up
+    ('grpc.initial_reconnect_backoff_ms', 100),
+    ('grpc.max_reconnect_backoff_ms', 1000),
+]
+
+
+def wait_channel_ready(channel, timeout):
+    """Block until channel reaches READY, woken by connectivity callbacks."""
+    ready = threading.Event()
+
+    def on_state(state):
+        if state == grpc.ChannelConnectivity.READY:
+            ready.set()
+
+    channel.subscribe(on_state, try_to_connect=True)
+    try:
+        return ready.wait(timeout)
+    finally:
+        channel.unsubscribe(on_state)
+
+
+def _serving(health_stub):
+    """Check a health stub reports SERVING, treating RPC errors as not ready."""
+    try:
+        response = health_stub.Check(health_pb2.HealthCheckRequest(), timeout=2.0)
+    except grpc.RpcError:
+        return False
+    return response.status == health_pb2.HealthCheckResponse.SERVING
+
+
+def _vram_used():
+    """Current VRAM use in MB, or None if it cannot be read."""
+    vram = read_vram_mb()
+    return vram[0] if vram else None
+
+
+def _watch_vram(readings, stop, interval=5.0):
+    """Record (elapsed_s, used_mb) every interval seconds until stop is set.
+
+    Reports each reading and whether the model appears to be loading, then
+    records a last reading once stop is set.
+    """
+    initial = last = _vram_used()
+    if initial is None:
+        return
+    start = time.monotonic()
+    readings.append((0.0, initial))
+    print(f"[llm_stack]   Initial VRAM: {initial}MB")
+    no_change_count = 0
+
+    while not stop.wait(interval):
+        current = _vram_used()
+        if current is None:
+            continue
+        elapsed = time.monotonic() - start
+        readings.append((elapsed, current))
+        print(f"[llm_stack]   [{elapsed:.0f}s] VRAM: {current}MB (change: {current - initial:+}MB)")
+
+        if abs(current - last) < 50:
+            no_change_count += 1
+            if no_change_count == 3:  # No change for 15 seconds
+                print("[llm_stack]   ⚠ VRAM stable - model likely already loaded")
+        else:
+            no_change_count = 0
+            print("[llm_stack]   ✓ Model loading detected")
+        last = current
+
+    current = _vram_used()
+    if current is not None:
+        readings.append((time.monotonic() - start, current))
+
+
+def _spawn(args, log_path):
+    """Start a service writing stdout and stderr to log_path."""
+    # Children need no fds beyond their std streams, so skip Popen's
+    # close-everything scan; our copy of the log fd is closed once spawned
+    with open(log_path, 'wb', buffering=0) as log:
+        return subprocess.Popen(
+            args,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            close_fds=False
+        )
+
+
+def _stop(process, timeout=2):
+    """Terminate a process, killing it if it does not exit in time."""
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class LlmStack:
+    """Ollama, the logger and the LLM service, started on first use and then shared.
+
+    Tests that need the ports for services of their own stop it through the
+    llm_stack_stopped fixture; the next test that needs it starts it again.
+    """
+
+    def __init__(self, startup_vram):
+        self.startup_vram = startup_vram
+        self.processes = {}
+        self.channel = None
+        self.stub = None
+
+    def ensure_started(self):
+        """Start the stack unless it is already up.
+
+        Returns:
+            Tuple of (LlmServiceStub, channel) connected to a SERVING LLM service
+        """
+        if self.stub is None:
+            try:
+                self._start()
+            except BaseException:
+                self.stop()
+                raise
+        return self.stub, self.channel
+
+    def _start(self):
+        print("\n[llm_stack] Cleaning up existing services...")
+        # Leftovers from an earlier run get no grace period, and we only wait
+        # as long as it takes for them to disappear from the process table
+        kill_by_name(_SERVICES_RE, grace=0)
+
+        if not ollama_up():
+            print("[llm_stack] Starting Ollama server...")
+            self.processes['ollama'] = subprocess.Popen(
+                ["ollama", "serve"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=False
+            )
+            if not poll_until(ollama_up, timeout=15):
+                pytest.fail("Ollama server failed to start")
+
+        print("[llm_stack] Starting logger service...")
+        self.processes['logger'] = _spawn([str(VENV_PY), str(LOGGER_SCRIPT)], 'test_logger.log')
+        logger_health = HealthClient(port=5001)
+        if not poll_until(lambda: logger_health.check() == "SERVING", timeout=12):
+            pytest.fail("Logger service failed to become ready")
+        logger_health.close()
+
+        print("[llm_stack] Starting LLM service...")
+        self.startup_vram.clear()
+        stop_watch = threading.Event()
+        watcher = threading.Thread(
+            target=_watch_vram, args=(self.startup_vram, stop_watch), daemon=True
+        )
+        watcher.start()
+        try:
+            self.processes['llm'] = _spawn([str(VENV_PY), str(LLM_SCRIPT)], 'test_llm.log')
+            self.channel = grpc.insecure_channel('127.0.0.1:5005', options=CHANNEL_OPTIONS)
+            # Sleep until the port accepts connections, then confirm it is SERVING
+            started = time.monotonic()
+            if not wait_channel_ready(self.channel, timeout=60):
+                pytest.fail("LLM service never accepted connections")
+            # Health checks ride the same channel the tests will use
+            llm_health = health_pb2_grpc.HealthStub(self.channel)
+            remaining = max(1, 60 - (time.monotonic() - started))
+            if not poll_until(lambda: _serving(llm_health), timeout=remaining):
+                pytest.fail("LLM service failed to become ready")
+        finally:
+            stop_watch.set()
+            watcher.join()
+        self.stub = services_pb2_grpc.LlmServiceStub(self.channel)
+        print(f"[llm_stack] ✓ LLM stack ready (LLM took {time.monotonic() - started:.1f}s)")
+
+    def stop(self):
+        """Stop whatever the stack started; a no-op when it is down."""
+        if self.channel is None and not self.processes:
+            return
+        print("\n[llm_stack] Cleaning up...")
+        if self.channel:
+            self.channel.close()
+        for name in ('llm', 'logger', 'ollama'):
+            _stop(self.processes.get(name))
+        self.processes.clear()
+        self.channel = None
+        self.stub = None
+
+
+@pytest.fixture(scope="session")
+def llm_startup_vram():
+    """VRAM readings taken while the LLM stack last started the LLM service.
+
+    Returns:
+        List of (elapsed_s, used_mb), filled in by llm_stack; empty if VRAM
+        cannot be read
+    """
+    return []
+
+
+@pytest.fixture(scope="session")
+def llm_stack_manager(llm_startup_vram):
+    """The session's LlmStack, stopped at the end of the session."""
+    stack = LlmStack(llm_startup_vram)
+    yield stack
+    stack.stop()
+
+
+@pytest.fixture
+def llm_stack(llm_stack_manager):
+    """Bring up Ollama, the logger and the LLM service, reusing them across the session.
+
+    VRAM is sampled every 5s while the LLM service starts up and recorded in
+    llm_startup_vram.
+
+    Returns:
+        Tuple of (LlmServiceStub, channel) connected to a SERVING LLM service
+    """
+    return llm_stack_manager.ensure_started()
+
+
+@pytest.fixture
+def llm_stack_stopped(llm_stack_manager):
+    """Stop the shared LLM stack, if it is up, for a test that starts its own services."""
+    llm_stack_manager.stop()
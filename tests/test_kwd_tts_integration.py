@@ -11,7 +11,25 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from proto import services_pb2, services_pb2_grpc
-from common.health_client import HealthClient
+from common.stub_cache import StubCache
+from common.proc_utils import kill_by_name, poll_until, stop_process_groups
+
+# Command lines of the services this test starts
+_SERVICES_RE = r"(loader|logger|kwd|tts)_service\.py"
+
+# Local channel tuning: infrequent keepalive pings, no retry bookkeeping
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 0),
+    ("grpc.enable_retries", 0),
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.max_receive_message_length", 16 << 20),
+]
+
+
+# Shared gRPC channels and health clients, one per port, reused across the test
+_stubs = StubCache(CHANNEL_OPTIONS)
 
 
 def test_kwd_tts_integration():
@@ -26,11 +44,7 @@ def test_kwd_tts_integration():
     try:
         # Clean up any existing services
         print("\n1. Cleaning up existing services...")
-        subprocess.run(["pkill", "-f", "loader_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "kwd_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "tts_service.py"], capture_output=True)
-        time.sleep(2)
+        kill_by_name(_SERVICES_RE, grace=2.0)
         
         venv_python = Path('.venv/bin/python').absolute()
         
@@ -40,17 +54,13 @@ def test_kwd_tts_integration():
         processes['logger'] = subprocess.Popen(
             [str(venv_python), 'services/logger/logger_service.py'],
             stdout=logger_log,
-            stderr=subprocess.STDOUT
+            stderr=subprocess.STDOUT,
+            start_new_session=True
         )
         
         # Wait for Logger
-        time.sleep(2)
-        logger_health = HealthClient(port=5001)
-        for i in range(10):
-            if logger_health.check() == "SERVING":
-                print("   ✓ Logger service ready")
-                break
-            time.sleep(1)
+        if poll_until(lambda: _stubs.health(5001).check() == "SERVING", timeout=12):
+            print("   ✓ Logger service ready")
         
         # Start TTS service
         print("\n3. Starting TTS service (Kokoro)...")
@@ -58,21 +68,17 @@ def test_kwd_tts_integration():
         processes['tts'] = subprocess.Popen(
             [str(venv_python), 'services/tts/tts_service.py'],
             stdout=tts_log,
-            stderr=subprocess.STDOUT
+            stderr=subprocess.STDOUT,
+            start_new_session=True
         )
         
         # Wait for TTS
         print("   Waiting for TTS service...")
-        tts_health = HealthClient(port=5006)
-        for i in range(30):
-            if tts_health.check() == "SERVING":
-                print("   ✓ TTS service ready")
-                break
-            time.sleep(1)
+        if poll_until(lambda: _stubs.health(5006).check() == "SERVING", timeout=30):
+            print("   ✓ TTS service ready")
         
         # Connect to TTS
-        tts_channel = grpc.insecure_channel('127.0.0.1:5006')
-        tts_stub = services_pb2_grpc.TtsServiceStub(tts_channel)
+        tts_stub = _stubs.stub(5006, services_pb2_grpc.TtsServiceStub)
         
         # Test warm-up greeting
         print("\n4. Testing warm-up greeting via TTS...")
@@ -119,20 +125,16 @@ def test_kwd_tts_integration():
         processes['kwd'] = subprocess.Popen(
             [str(venv_python), 'services/kwd/kwd_service.py'],
             stdout=kwd_log,
-            stderr=subprocess.STDOUT
+            stderr=subprocess.STDOUT,
+            start_new_session=True
         )
         
         # Wait for KWD
-        kwd_health = HealthClient(port=5003)
-        for i in range(20):
-            if kwd_health.check() == "SERVING":
-                print("   ✓ KWD service ready")
-                break
-            time.sleep(1)
+        if poll_until(lambda: _stubs.health(5003).check() == "SERVING", timeout=20):
+            print("   ✓ KWD service ready")
         
         # Connect to KWD
-        kwd_channel = grpc.insecure_channel('127.0.0.1:5003')
-        kwd_stub = services_pb2_grpc.KwdServiceStub(kwd_channel)
+        kwd_stub = _stubs.stub(5003, services_pb2_grpc.KwdServiceStub)
         
         print("\n7. Testing KWD-TTS integration flow:")
         print("   The flow should be:")
@@ -204,19 +206,12 @@ def test_kwd_tts_integration():
     finally:
         # Cleanup
         print("\n9. Cleaning up services...")
+        _stubs.close()
+        
+        for name, outcome in stop_process_groups(processes).items():
+            print(f"   {name} {outcome}")
         
-        for name, process in processes.items():
-            if process and process.poll() is None:
-                print(f"   Stopping {name}...")
-                process.terminate()
-                try:
-                    process.wait(timeout=2)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-        
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "kwd_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "tts_service.py"], capture_output=True)
+        kill_by_name(_SERVICES_RE, grace=2.0)
 
 
 if __name__ == "__main__":
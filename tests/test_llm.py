@@ -11,6 +11,23 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
+from common.stub_cache import StubCache
+
+# Buffered token bytes are written to stdout once they exceed this size
+STDOUT_FLUSH_BYTES = 256
+
+
+# Shared gRPC channels, one per port, reused by every stub in this module
+_stubs = StubCache()
+
+
+def flush_tokens(buf: bytearray):
+    """Write buffered token bytes to stdout in a single call."""
+    if buf:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(buf)
+        sys.stdout.buffer.flush()
+        buf.clear()
 
 
 def test_llm_service():
@@ -29,8 +46,7 @@ def test_llm_service():
         return False
     
     # Connect to LLM service
-    channel = grpc.insecure_channel('127.0.0.1:5005')
-    stub = services_pb2_grpc.LlmServiceStub(channel)
+    stub = _stubs.stub(5005, services_pb2_grpc.LlmServiceStub)
     
     # Create a dialog ID
     dialog_id = f"test_{uuid.uuid4().hex[:8]}"
@@ -57,21 +73,26 @@ def test_llm_service():
         print("="*50)
         
         # Stream response
+        buf = bytearray()
         for response in stub.Complete(request):
             if response.text:
                 full_response.append(response.text)
-                print(response.text, end='', flush=True)
+                buf += response.text.encode()
                 
                 # Track first token time
                 if first_token_time is None:
                     first_token_time = time.time()
                     latency = (first_token_time - start_time) * 1000
+                    flush_tokens(buf)
                     print(f"\n[First token latency: {latency:.0f}ms]\n", end='')
+                elif len(buf) > STDOUT_FLUSH_BYTES:
+                    flush_tokens(buf)
                     
             if response.eot:
                 token_count = response.token_count
                 total_time = response.latency_ms
                 break
+        flush_tokens(buf)
         
         print("\n" + "="*50)
         
@@ -96,9 +117,12 @@ def test_llm_service():
         
         for response in stub.Complete(request2):
             if response.text:
-                print(response.text, end='', flush=True)
+                buf += response.text.encode()
+                if len(buf) > STDOUT_FLUSH_BYTES:
+                    flush_tokens(buf)
             if response.eot:
                 break
+        flush_tokens(buf)
                 
         print("\n" + "="*50)
         
@@ -108,7 +132,7 @@ def test_llm_service():
     except KeyboardInterrupt:
         print("\n\nStopped by user")
     finally:
-        channel.close()
+        _stubs.close()
         health_client.close()
     
     print("\nTest complete!")
@@ -120,8 +144,7 @@ def test_error_handling():
     print("\nTesting error handling...")
     
     # Connect to LLM service
-    channel = grpc.insecure_channel('127.0.0.1:5005')
-    stub = services_pb2_grpc.LlmServiceStub(channel)
+    stub = _stubs.stub(5005, services_pb2_grpc.LlmServiceStub)
     
     try:
         # Test with empty request
@@ -138,7 +161,7 @@ def test_error_handling():
     except grpc.RpcError as e:
         print(f"Expected error: {e}")
     finally:
-        channel.close()
+        _stubs.close()
     
     print("Error handling test complete")
 
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Test LLM service with actual model loading via Ollama."""
 
+import os
 import sys
 import time
 import subprocess
@@ -13,24 +14,97 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
+from common.net_utils import ollama_models, ollama_up
+from common.proc_utils import kill_by_name, poll_until
+from common.vram_logger import read_vram_mb
+from common.channel_pool import ChannelPool
 
+# Command lines of the services this test starts
+_SERVICES_RE = r"(llm|logger)_service\.py"
 
-def check_ollama_status():
-    """Check if Ollama is running and what models are available."""
-    result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-    if result.returncode != 0:
-        return False, []
+# Local channel tuning: infrequent keepalive pings, no retry bookkeeping,
+# and a wide initial flow-control window for token streaming
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 0),
+    ("grpc.enable_retries", 0),
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.max_receive_message_length", 16 << 20),
+    ("grpc.http2.lookahead_bytes", 4 * 1024 * 1024),
+    ("grpc.http2.min_time_between_pings_ms", 10000),
+]
+
+
+async def run_query(stub, query, dialog_id):
+    """Stream one completion and return its printable report."""
+    request = services_pb2.CompleteRequest(
+        text=query,
+        dialog_id=dialog_id,
+        turn_number=1,
+        conversation_history=""
+    )
+    
+    lines = [f"\n   Query: '{query}'"]
+    response_text = []
+    first_token_time = None
+    start_time = time.time()
     
-    # Parse model list
-    models = []
-    lines = result.stdout.strip().split('\n')
-    if len(lines) > 1:  # Skip header
-        for line in lines[1:]:
-            parts = line.split()
-            if parts:
-                models.append(parts[0])
+    try:
+        async for chunk in stub.Complete(request):
+            if chunk.text:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response_text.append(chunk.text)
+            
+            if chunk.eot:
+                break
+        
+        if response_text:
+            latency = (first_token_time - start_time) * 1000
+            lines.append(f"   Response: [{latency:.0f}ms] {''.join(response_text)}")
+            total_time = (time.time() - start_time) * 1000
+            lines.append(f"   Tokens: {chunk.token_count}, Total time: {total_time:.0f}ms")
+        else:
+            lines.append("   Response: (no response)")
+            
+    except grpc.RpcError as e:
+        lines.append(f"   Error: {e}")
     
-    return True, models
+    return "\n".join(lines)
+
+
+async def run_queries(queries):
+    """Run all queries concurrently and return their reports in query order."""
+    pool = ChannelPool('127.0.0.1:5005', services_pb2_grpc.LlmServiceStub, options=CHANNEL_OPTIONS)
+    run_id = int(time.time())
+    try:
+        return await asyncio.gather(*(
+            run_query(pool.stub(), query, f"test_{run_id}_{i}")
+            for i, query in enumerate(queries)
+        ))
+    finally:
+        await pool.close()
+
+
+def check_ollama_status():
+    """Check if Ollama is running and what models are available."""
+    models = ollama_models(timeout=2)
+    return models is not None, sorted(models or ())
+
+
+def replace_config(config_path: Path, content: bytes):
+    """Atomically swap in new config file contents."""
+    tmp_path = config_path.with_suffix(".ini.tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, config_path)
+
+
+def print_gpu_memory():
+    """Print GPU memory usage via NVML, falling back to nvidia-smi."""
+    vram = read_vram_mb()
+    if vram:
+        print(f"   GPU Memory - Used: {vram[0]} MiB, Free: {vram[1]} MiB")
 
 
 def start_ollama_server():
@@ -44,26 +118,24 @@ def start_ollama_server():
     )
     
     # Wait for server to be ready
-    for i in range(10):
-        time.sleep(1)
-        result = subprocess.run(
-            ["curl", "-s", "http://localhost:11434/api/tags"],
-            capture_output=True
-        )
-        if result.returncode == 0:
-            print("   ✓ Ollama server is ready")
-            return ollama_process
+    if poll_until(lambda: ollama_up(timeout=0.2), timeout=10):
+        print("   ✓ Ollama server is ready")
+        return ollama_process
         
     print("   ✗ Ollama server failed to start")
     return None
 
 
-def ensure_model_available(model_name="llama3.2:1b"):
-    """Ensure a small model is available for testing."""
+def ensure_model_available(models, model_name="llama3.2:1b"):
+    """Ensure a small model is available for testing.
+    
+    Args:
+        models: Model names reported by check_ollama_status
+        model_name: Model to look for or pull
+    """
     print(f"Checking for model: {model_name}")
     
-    result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-    if model_name in result.stdout:
+    if model_name in models:
         print(f"   ✓ Model {model_name} is already available")
         return True
     
@@ -92,13 +164,13 @@ def test_llm_with_model():
     ollama_process = None
     logger_process = None
     llm_process = None
+    config_path = Path("config/config.ini")
+    original_config = None
     
     try:
         # Clean up existing services
         print("\n1. Cleaning up existing services...")
-        subprocess.run(["pkill", "-f", "llm_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        time.sleep(1)
+        kill_by_name(_SERVICES_RE, grace=2.0)
         
         # Check/start Ollama
         print("\n2. Checking Ollama status...")
@@ -119,20 +191,17 @@ def test_llm_with_model():
         
         # Ensure we have a model
         model_name = "llama3.2:1b"  # Use small 1B model for testing
-        if not ensure_model_available(model_name):
+        if not ensure_model_available(models, model_name):
             return False
         
-        # Update config to use our test model
-        config_path = Path("config/config.ini")
-        config_content = config_path.read_text()
-        
         # Temporarily update the model in config
-        original_config = config_content
+        original_config = config_path.read_bytes()
+        config_content = original_config.decode()
         updated_config = config_content.replace(
             "model = llama3.1:8b",
             f"model = {model_name}"
         )
-        if updated_config == original_config:
+        if updated_config == config_content:
             # Add model config if not present
             if "[llm]" in updated_config:
                 updated_config = updated_config.replace(
@@ -140,7 +209,7 @@ def test_llm_with_model():
                     f"[llm]\nmodel = {model_name}"
                 )
         
-        config_path.write_text(updated_config)
+        replace_config(config_path, updated_config.encode())
         
         # Start logger service
         print("\n3. Starting logger service...")
@@ -156,13 +225,9 @@ def test_llm_with_model():
         print(f"   Logger started with PID: {logger_process.pid}")
         
         # Wait for logger
-        time.sleep(2)
         logger_health = HealthClient(port=5001)
-        for i in range(10):
-            if logger_health.check() == "SERVING":
-                print("   ✓ Logger service is ready")
-                break
-            time.sleep(1)
+        if poll_until(lambda: logger_health.check() == "SERVING", timeout=12):
+            print("   ✓ Logger service is ready")
         
         # Start LLM service
         print("\n4. Starting LLM service...")
@@ -180,23 +245,12 @@ def test_llm_with_model():
         print("\n5. Waiting for LLM service to initialize...")
         llm_health = HealthClient(port=5005)
         
-        for i in range(30):
-            status = llm_health.check()
-            if status == "SERVING":
-                print("   ✓ LLM service is ready!")
-                break
-            elif i % 5 == 0:
-                print(f"   Still loading... ({i}s)")
-            time.sleep(1)
+        if poll_until(lambda: llm_health.check() == "SERVING", timeout=30):
+            print("   ✓ LLM service is ready!")
         else:
             print("   ✗ LLM service failed to become ready")
             return False
         
-        # Connect to LLM service
-        print("\n6. Connecting to LLM service...")
-        channel = grpc.insecure_channel('127.0.0.1:5005')
-        stub = services_pb2_grpc.LlmServiceStub(channel)
-        
         # Test queries
         test_queries = [
             "Hello! How are you today?",
@@ -205,62 +259,19 @@ def test_llm_with_model():
             "What's the weather like?"
         ]
         
+        print("\n6. Connecting to LLM service...")
         print("\n7. Testing LLM completions...")
-        for query in test_queries:
-            print(f"\n   Query: '{query}'")
-            print("   Response: ", end="", flush=True)
-            
-            request = services_pb2.CompleteRequest(
-                text=query,
-                dialog_id=f"test_{int(time.time())}",
-                turn_number=1,
-                conversation_history=""
-            )
-            
-            response_text = []
-            first_token_time = None
-            start_time = time.time()
-            
-            try:
-                for chunk in stub.Complete(request):
-                    if chunk.text:
-                        if first_token_time is None:
-                            first_token_time = time.time()
-                            latency = (first_token_time - start_time) * 1000
-                            print(f"[{latency:.0f}ms] ", end="", flush=True)
-                        
-                        print(chunk.text, end="", flush=True)
-                        response_text.append(chunk.text)
-                    
-                    if chunk.eot:
-                        total_time = (time.time() - start_time) * 1000
-                        print(f"\n   Tokens: {chunk.token_count}, Total time: {total_time:.0f}ms")
-                        break
-                
-                if not response_text:
-                    print("(no response)")
-                    
-            except grpc.RpcError as e:
-                print(f"\n   Error: {e}")
+        for report in asyncio.run(run_queries(test_queries)):
+            print(report)
         
         # Check GPU/CPU usage
         print("\n8. Checking resource usage...")
-        result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=memory.used,memory.free", "--format=csv,noheader"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            used, free = result.stdout.strip().split(', ')
-            print(f"   GPU Memory - Used: {used}, Free: {free}")
+        print_gpu_memory()
         
         print("\n" + "="*80)
         print("✓ LLM TEST COMPLETED SUCCESSFULLY!")
         print("="*80)
         
-        # Restore original config
-        config_path.write_text(original_config)
-        
         return True
         
     except Exception as e:
@@ -268,15 +279,13 @@ def test_llm_with_model():
         import traceback
         traceback.print_exc()
         
-        # Restore original config
-        try:
-            config_path.write_text(original_config)
-        except:
-            pass
-        
         return False
         
     finally:
+        # Restore original config
+        if original_config is not None:
+            replace_config(config_path, original_config)
+        
         # Cleanup
         print("\n9. Cleaning up...")
         if llm_process:
@@ -305,12 +314,16 @@ def test_llm_with_model():
                 ollama_process.kill()
         
         # Show LLM log tail
-        if Path('test_llm.log').exists():
+        log_path = Path('test_llm.log')
+        if log_path.exists():
             print("\n10. Last LLM log lines:")
-            with open('test_llm.log', 'r') as f:
-                lines = f.readlines()
-                for line in lines[-20:]:
-                    print(f"   {line.rstrip()}")
+            # Only read the last 8 KiB so a runaway log stays cheap to tail
+            offset = max(0, log_path.stat().st_size - 8192)
+            with log_path.open('rb') as f:
+                f.seek(offset)
+                data = f.read()
+            for line in data.decode(errors='replace').splitlines()[-20:]:
+                print(f"   {line.rstrip()}")
 
 
 if __name__ == "__main__":
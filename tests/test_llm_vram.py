@@ -1,79 +1,326 @@
 #!/usr/bin/env python3
 """Test LLM service with VRAM measurements."""
 
+import os
 import sys
 import time
+import re
+from itertools import islice
+import json
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import subprocess
 import grpc
+import numpy as np
+import pytest
 from pathlib import Path
 
-# Add directories to path
-sys.path.insert(0, str(Path(__file__).parent))
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
 from common.gpu_monitor import GPUMonitor
+from common.net_utils import OLLAMA_PORT, ollama_up, port_open
+from common.proc_utils import poll_until, stop_process_groups
+from common.vram_logger import nvml, get_nvml_handle, read_vram_mb
+
+
+# Ports of the services this test starts itself
+LLM_PORT = 5005
+LOGGER_PORT = 5001
+
+# SYSTEM """...""" block of an Ollama Modelfile
+_SYSTEM_RE = re.compile(rb'SYSTEM\s+"""(.*?)"""', re.DOTALL)
+
+# Keepalive and HTTP/2 tuning for the LLM streaming channels
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.http2.min_time_between_pings_ms', 10000),
+    ('grpc.max_receive_message_length', 4 << 20),
+    ('grpc.use_local_subchannel_pool', 1),
+]
+
+# Separate watchdogs: services must come up within INIT_TIMEOUT_S, and a
+# query that produces no token within FIRST_TOKEN_TIMEOUT_S is cancelled
+INIT_TIMEOUT_S = 60
+FIRST_TOKEN_TIMEOUT_S = 30
+
+# Streamed tokens are written out by a drain thread at this interval
+FLUSH_INTERVAL_S = 0.05
+
+
+class TokenPrinter:
+    """Collect streamed tokens and write them to stdout from a background drain thread."""
+    
+    def __init__(self, interval: float = FLUSH_INTERVAL_S):
+        # deque append/popleft are thread-safe, so the stream loop never takes a lock
+        self.buf = deque()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._drain, args=(interval,), daemon=True)
+        self._thread.start()
+    
+    def add(self, text: str):
+        """Queue a token; the stream loop does no I/O."""
+        self.buf.append(text)
+    
+    def _drain(self, interval: float):
+        while not self._done.wait(interval):
+            self._write()
+    
+    def _write(self):
+        parts = []
+        try:
+            while True:
+                parts.append(self.buf.popleft())
+        except IndexError:
+            pass
+        if parts:
+            sys.stdout.write(''.join(parts))
+            sys.stdout.flush()
+    
+    def flush(self):
+        """Stop the drain thread and write out anything still queued."""
+        self._done.set()
+        self._thread.join()
+        self._write()
 
 
 def get_vram_usage():
-    """Get current VRAM usage in MB."""
-    result = subprocess.run(
-        ["nvidia-smi", "--query-gpu=memory.used,memory.free", "--format=csv,noheader,nounits"],
-        capture_output=True,
-        text=True
+    """Get current VRAM usage in MB as (used, free)."""
+    return read_vram_mb() or (0, 0)
+
+
+def report_stream_latency(start_ns, token_times, path='test_llm_vram_latency.json'):
+    """Print TTFT and inter-token latency percentiles and write them as JSON."""
+    if not token_times:
+        return
+    ttft_ms = (token_times[0] - start_ns) / 1e6
+    itl_ms = np.diff(np.asarray(token_times, dtype=np.int64)) / 1e6
+    
+    stats = {'ttft_ms': ttft_ms, 'tokens': len(token_times)}
+    print("\n    Latency          Mean      p50      p95      p99")
+    print(f"    TTFT (ms)    {ttft_ms:8.1f}")
+    if itl_ms.size:
+        p50, p95, p99 = np.percentile(itl_ms, [50, 95, 99])
+        stats['itl_ms'] = {'mean': float(itl_ms.mean()), 'p50': float(p50),
+                           'p95': float(p95), 'p99': float(p99)}
+        print(f"    ITL (ms)     {itl_ms.mean():8.1f} {p50:8.1f} {p95:8.1f} {p99:8.1f}")
+    
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+async def ask_concurrently(queries):
+    """Stream all queries at once over one aio channel, printing each when it completes."""
+    stdout_lock = asyncio.Lock()
+    run_id = int(time.time())
+    
+    async with grpc.aio.insecure_channel('127.0.0.1:5005', options=CHANNEL_OPTIONS) as channel:
+        stub = services_pb2_grpc.LlmServiceStub(channel)
+        
+        async def ask(i, query):
+            request = services_pb2.CompleteRequest(
+                text=query,
+                dialog_id=f"test_{run_id}_{i}",
+                turn_number=1,
+                conversation_history=""
+            )
+            response_text = []
+            try:
+                async for chunk in stub.Complete(request):
+                    if chunk.text:
+                        response_text.append(chunk.text)
+                    if chunk.eot:
+                        break
+                result = ''.join(response_text)
+            except grpc.RpcError as e:
+                result = f"Error: {e}"
+            
+            async with stdout_lock:
+                print(f"\n    Query: '{query}'")
+                print(f"    Response: {result}")
+        
+        await asyncio.gather(*(ask(i, query) for i, query in enumerate(queries)))
+
+
+def spawn_logged(args, log_path):
+    """Start a service in its own session with stdout/stderr going to log_path."""
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        return subprocess.Popen(
+            args,
+            stdout=log_fd,
+            stderr=subprocess.STDOUT,
+            start_new_session=True
+        )
+    finally:
+        # The child holds its own copy; ours is closed even if Popen fails
+        os.close(log_fd)
+
+
+def warm_up(stub):
+    """Send a throwaway prompt and return its (cold) first-token latency in ms."""
+    request = services_pb2.CompleteRequest(
+        text=" ",
+        dialog_id="warmup",
+        turn_number=0,
+        conversation_history=""
     )
-    if result.returncode == 0:
-        used, free = result.stdout.strip().split(', ')
-        return int(used.strip().replace(' MiB', '')), int(free.strip().replace(' MiB', ''))
-    return 0, 0
+    start_ns = time.perf_counter_ns()
+    first_token_ms = None
+    try:
+        for chunk in stub.Complete(request, timeout=INIT_TIMEOUT_S):
+            if chunk.text and first_token_ms is None:
+                first_token_ms = (time.perf_counter_ns() - start_ns) / 1e6
+            if chunk.eot:
+                break
+    except grpc.RpcError as e:
+        print(f"    Warmup failed: {e.code()}")
+    return first_token_ms
+
+
+class VramSampler(threading.Thread):
+    """Background thread recording VRAM into a ring buffer, for peak usage and the trace.
+    
+    Between events its last sample can be up to a heartbeat old, so phase
+    boundaries take a fresh get_vram_usage() reading instead.
+    
+    Where the GPU supports NVML performance-state/clock events, the thread sleeps
+    in nvmlEventSetWait and samples when the GPU changes state (model loads and
+    unloads move it out of idle), plus a slow heartbeat. Otherwise it polls at
+    a fixed interval.
+    """
+    
+    def __init__(self, interval: float = 0.25, heartbeat: float = 1.0, maxlen: int = 2048):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.samples = deque(maxlen=maxlen)
+        self._stop_event = threading.Event()
+        self._event_set = self._open_event_set()
+        # Take one sample up front so peak() is valid before the thread runs
+        self._sample()
+    
+    @staticmethod
+    def _open_event_set():
+        """Register for GPU state-change events, or return None if unsupported."""
+        handle = get_nvml_handle()
+        if handle is None:
+            return None
+        try:
+            wanted = nvml.nvmlEventTypePState | nvml.nvmlEventTypeClock
+            supported = nvml.nvmlDeviceGetSupportedEventTypes(handle) & wanted
+            if not supported:
+                return None
+            event_set = nvml.nvmlEventSetCreate()
+            nvml.nvmlDeviceRegisterEvents(handle, supported, event_set)
+            return event_set
+        except (nvml.NVMLError, AttributeError):
+            return None
+    
+    def _sample(self):
+        used, free = get_vram_usage()
+        self.samples.append((time.time(), used, free))
+    
+    def run(self):
+        if self._event_set is None:
+            while not self._stop_event.wait(self.interval):
+                self._sample()
+            return
+        
+        timeout_ms = int(self.heartbeat * 1000)
+        while not self._stop_event.is_set():
+            try:
+                nvml.nvmlEventSetWait(self._event_set, timeout_ms)
+            except nvml.NVMLError:
+                pass  # Timed out: take a heartbeat sample
+            self._sample()
+    
+    def peak(self):
+        """Highest used VRAM seen so far, as (used, free) in MB."""
+        _, used, free = max(self.samples, key=lambda sample: sample[1])
+        return used, free
+    
+    def stop(self):
+        """Stop sampling and wait for the thread to exit."""
+        self._stop_event.set()
+        self.join()
+        if self._event_set is not None:
+            nvml.nvmlEventSetFree(self._event_set)
+            self._event_set = None
+    
+    def dump(self, path):
+        """Write the collected (timestamp, used, free) trace as JSON."""
+        with open(path, 'w') as f:
+            json.dump([{'ts': ts, 'used': used, 'free': free} for ts, used, free in self.samples], f)
 
 
-def test_llm_vram():
+def test_llm_vram(llm_stack_stopped):
     """Test LLM service with VRAM measurements."""
     
     print("\n" + "="*80)
     print("LLM SERVICE VRAM USAGE TEST")
     print("="*80)
     
+    # The session's shared LLM stack has been stopped so the start-up can be
+    # measured from scratch; anything still on the ports is not ours to kill
+    busy = [name for name, port in (('LLM', LLM_PORT), ('logger', LOGGER_PORT)) if port_open(port)]
+    if busy:
+        pytest.fail(f"{' and '.join(busy)} port already taken by a service this test does not own")
+    
     ollama_process = None
     logger_process = None
     llm_process = None
     
     # Track VRAM usage
     vram_measurements = {}
+    sampler = VramSampler()
+    sampler.start()
+    startup_pool = ThreadPoolExecutor(max_workers=2)
     
     try:
-        # Clean up existing services
-        print("\n1. Cleaning up existing services...")
-        subprocess.run(["pkill", "-f", "llm_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "ollama"], capture_output=True)
-        time.sleep(3)
+        # An Ollama already running is reused (and left running afterwards)
+        print("\n1. Checking for a running Ollama server...")
+        ollama_shared = ollama_up()
+        if ollama_shared:
+            print("   Reusing it; its loaded models count towards the baseline")
         
         # Initial VRAM measurement
         used_initial, free_initial = get_vram_usage()
         vram_measurements['initial'] = {'used': used_initial, 'free': free_initial}
         print(f"\n2. Initial VRAM: {used_initial} MB used, {free_initial} MB free")
         
-        # Start Ollama server
-        print("\n3. Starting Ollama server...")
-        ollama_process = subprocess.Popen(
-            ["ollama", "serve"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+        # Start Ollama server, with the logger (no GPU use) coming up alongside it
+        print("\n3. Starting Ollama server and logger service...")
+        if not ollama_shared:
+            ollama_process = subprocess.Popen(
+                ["ollama", "serve"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+        
+        venv_python = Path('.venv/bin/python').absolute()
+        logger_script = Path('services/logger/logger_service.py').absolute()
+        
+        logger_process = spawn_logged([str(venv_python), str(logger_script)], 'test_logger.log')
+        print(f"   Logger started with PID: {logger_process.pid}")
+        
+        # Probe logger readiness in the background while Ollama warms up
+        logger_health = HealthClient(port=5001)
+        logger_ready = startup_pool.submit(
+            poll_until, lambda: logger_health.check() == "SERVING", INIT_TIMEOUT_S
         )
         
-        # Wait for Ollama to be ready
-        for i in range(10):
-            time.sleep(1)
-            result = subprocess.run(
-                ["ollama", "list"],
-                capture_output=True,
-                text=True
-            )
-            if result.returncode == 0:
-                print("   ✓ Ollama server is ready")
-                break
+        # Wait on the port with bare TCP connects, then confirm the API once
+        if poll_until(lambda: port_open(OLLAMA_PORT), INIT_TIMEOUT_S) and poll_until(ollama_up, 5):
+            print("   ✓ Ollama server is ready")
+        else:
+            pytest.fail("Ollama server failed to start")
         
         # VRAM after Ollama start
         used_ollama, free_ollama = get_vram_usage()
@@ -83,14 +330,14 @@ def test_llm_vram():
         
         # Load model directly with Ollama to measure model VRAM
         print("\n5. Loading llama3.1:8b-instruct-q4_K_M model...")
-        start_time = time.time()
+        start_time = time.perf_counter()
         result = subprocess.run(
             ["ollama", "run", "llama3.1:8b-instruct-q4_K_M", "Hi"],
             capture_output=True,
             text=True,
             timeout=60
         )
-        load_time = time.time() - start_time
+        load_time = time.perf_counter() - start_time
         
         # VRAM after model load
         used_model, free_model = get_vram_usage()
@@ -105,69 +352,46 @@ def test_llm_vram():
         modelfile_path = Path("config/Modelfile")
         system_prompt = ""
         if modelfile_path.exists():
-            content = modelfile_path.read_text()
-            # Extract SYSTEM section
-            if 'SYSTEM """' in content:
-                start = content.index('SYSTEM """') + len('SYSTEM """')
-                end = content.index('"""', start)
-                system_prompt = content[start:end].strip()
+            # The file is tiny; an empty one simply has no SYSTEM block
+            match = _SYSTEM_RE.search(modelfile_path.read_bytes())
+            if match:
+                system_prompt = match.group(1).decode('utf-8').strip()
+            if system_prompt:
                 print(f"   System prompt loaded ({len(system_prompt)} chars):")
                 print("   ---")
-                for line in system_prompt.split('\n')[:5]:  # Show first 5 lines
+                lines = iter(system_prompt.splitlines())
+                for line in islice(lines, 5):  # Show first 5 lines
                     print(f"   {line}")
-                if len(system_prompt.split('\n')) > 5:
+                if next(lines, None) is not None:
                     print("   ...")
                 print("   ---")
+            else:
+                print("   ✗ No SYSTEM block found in Modelfile")
         else:
             print("   ✗ Modelfile not found")
         
-        # Start logger service
-        print("\n7. Starting logger service...")
-        venv_python = Path('.venv/bin/python').absolute()
-        logger_script = Path('services/logger/logger_service.py').absolute()
-        
-        logger_log = open('test_logger.log', 'w')
-        logger_process = subprocess.Popen(
-            [str(venv_python), str(logger_script)],
-            stdout=logger_log,
-            stderr=subprocess.STDOUT
-        )
-        print(f"   Logger started with PID: {logger_process.pid}")
-        
-        # Wait for logger
-        time.sleep(2)
-        logger_health = HealthClient(port=5001)
-        for i in range(10):
-            if logger_health.check() == "SERVING":
-                print("   ✓ Logger service is ready")
-                break
-            time.sleep(1)
+        # Logger has been starting since step 3
+        print("\n7. Waiting for logger service...")
+        if logger_ready.result():
+            print("   ✓ Logger service is ready")
+        else:
+            pytest.fail("Logger service failed to become ready")
         
         # Start LLM service
         print("\n8. Starting LLM service...")
         llm_script = Path('services/llm/llm_service.py').absolute()
         
-        llm_log = open('test_llm.log', 'w')
-        llm_process = subprocess.Popen(
-            [str(venv_python), str(llm_script)],
-            stdout=llm_log,
-            stderr=subprocess.STDOUT
-        )
+        llm_process = spawn_logged([str(venv_python), str(llm_script)], 'test_llm.log')
         print(f"   LLM started with PID: {llm_process.pid}")
         
         # Wait for LLM service
         print("\n9. Waiting for LLM service to initialize...")
         llm_health = HealthClient(port=5005)
         
-        for i in range(20):
-            status = llm_health.check()
-            if status == "SERVING":
-                print("   ✓ LLM service is ready!")
-                break
-            time.sleep(1)
+        if poll_until(lambda: llm_health.check() == "SERVING", INIT_TIMEOUT_S):
+            print("   ✓ LLM service is ready!")
         else:
-            print("   ✗ LLM service failed to become ready")
-            return False
+            pytest.fail("LLM service failed to become ready")
         
         # VRAM after LLM service start
         used_llm_service, free_llm_service = get_vram_usage()
@@ -177,8 +401,15 @@ def test_llm_vram():
         
         # Connect to LLM service
         print("\n11. Testing LLM with system prompt...")
-        channel = grpc.insecure_channel('127.0.0.1:5005')
+        channel = grpc.insecure_channel('127.0.0.1:5005', options=CHANNEL_OPTIONS)
         stub = services_pb2_grpc.LlmServiceStub(channel)
+        # Have the HTTP/2 connection up before anything is timed
+        grpc.channel_ready_future(channel).result(timeout=5)
+        
+        # Warm the model up so the timed query below measures steady state
+        cold_ms = warm_up(stub)
+        if cold_ms is not None:
+            print(f"    Cold first-token latency (warmup): {cold_ms:.0f}ms")
         
         # Test query that should use the system prompt
         test_query = "Who are you?"
@@ -193,30 +424,47 @@ def test_llm_vram():
         )
         
         response_text = []
-        start_time = time.time()
-        first_token_time = None
+        # perf_counter_ns stamp of every text chunk; the first one is the TTFT point
+        token_times = []
+        printer = TokenPrinter()
         
+        start_ns = time.perf_counter_ns()
+        call = stub.Complete(request)
+        # Cancel the stream if the model stalls before producing anything
+        watchdog = threading.Timer(FIRST_TOKEN_TIMEOUT_S, call.cancel)
+        watchdog.start()
         try:
-            for chunk in stub.Complete(request):
+            for chunk in call:
                 if chunk.text:
-                    if first_token_time is None:
-                        first_token_time = time.time()
-                        latency = (first_token_time - start_time) * 1000
-                        print(f"[{latency:.0f}ms] ", end="", flush=True)
+                    token_times.append(time.perf_counter_ns())
+                    if len(token_times) == 1:
+                        watchdog.cancel()
+                        latency_ms = (token_times[0] - start_ns) / 1e6
+                        print(f"[{latency_ms:.0f}ms] ", end="", flush=True)
                     
-                    print(chunk.text, end="", flush=True)
+                    printer.add(chunk.text)
                     response_text.append(chunk.text)
                 
                 if chunk.eot:
-                    total_time = (time.time() - start_time) * 1000
-                    print(f"\n    Total time: {total_time:.0f}ms")
+                    printer.flush()
+                    total_ms = (time.perf_counter_ns() - start_ns) / 1e6
+                    print(f"\n    Total time: {total_ms:.0f}ms")
                     break
         except grpc.RpcError as e:
-            print(f"\n    Error: {e}")
+            printer.flush()
+            if e.code() == grpc.StatusCode.CANCELLED:
+                print(f"\n    ✗ No first token within {FIRST_TOKEN_TIMEOUT_S}s")
+            else:
+                print(f"\n    Error: {e}")
+        finally:
+            watchdog.cancel()
+        
+        report_stream_latency(start_ns, token_times)
         
         # Final VRAM measurement after inference
         used_final, free_final = get_vram_usage()
         vram_measurements['after_inference'] = {'used': used_final, 'free': free_final}
+        used_peak, free_peak = sampler.peak()
         
         # Print VRAM summary
         print("\n" + "="*80)
@@ -229,7 +477,7 @@ def test_llm_vram():
         print(f"After inference:         {vram_measurements['after_inference']['used']:5d} MB used (+{vram_measurements['after_inference']['used'] - vram_measurements['llm_service_started']['used']} MB)")
         print("-"*80)
         print(f"LLAMA 3.1 8B Q4 MODEL:   {vram_measurements['model_loaded']['used'] - vram_measurements['ollama_started']['used']:5d} MB")
-        print(f"Peak VRAM usage:         {vram_measurements['after_inference']['used']:5d} MB")
+        print(f"Peak VRAM usage:         {used_peak:5d} MB ({free_peak} MB free at the time)")
         print(f"Free VRAM remaining:     {vram_measurements['after_inference']['free']:5d} MB")
         print("="*80)
         
@@ -241,75 +489,36 @@ def test_llm_vram():
             "Tell me about yourself in one sentence."
         ]
         
-        for query in test_queries:
-            print(f"\n    Query: '{query}'")
-            print("    Response: ", end="", flush=True)
-            
-            request = services_pb2.CompleteRequest(
-                text=query,
-                dialog_id=f"test_{int(time.time())}",
-                turn_number=1,
-                conversation_history=""
-            )
-            
-            response_text = []
-            try:
-                for chunk in stub.Complete(request):
-                    if chunk.text:
-                        print(chunk.text, end="", flush=True)
-                        response_text.append(chunk.text)
-                    if chunk.eot:
-                        break
-                print()  # New line after response
-            except grpc.RpcError as e:
-                print(f"Error: {e}")
+        asyncio.run(ask_concurrently(test_queries))
         
         print("\n" + "="*80)
         print("✓ LLM VRAM TEST COMPLETED SUCCESSFULLY!")
         print("="*80)
         
-        return True
-        
     except Exception as e:
         print(f"\n✗ Test failed with error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        raise
         
     finally:
         # Cleanup
         print("\n13. Cleaning up...")
-        if llm_process:
-            llm_process.terminate()
-            try:
-                llm_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                llm_process.kill()
-            print("    LLM service stopped")
-        
-        if logger_process:
-            logger_process.terminate()
-            try:
-                logger_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                logger_process.kill()
-            print("    Logger service stopped")
-        
-        if ollama_process:
-            print("    Stopping Ollama server...")
-            ollama_process.terminate()
-            try:
-                ollama_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                ollama_process.kill()
-            subprocess.run(["pkill", "-f", "ollama"], capture_output=True)
+        startup_pool.shutdown(wait=False)
+        # Returns once each whole group is gone, Ollama's model runners
+        # included, so the VRAM reading below sees it released
+        stopped = stop_process_groups(
+            {'LLM service': llm_process, 'Logger service': logger_process, 'Ollama server': ollama_process}
+        )
+        for name, outcome in stopped.items():
+            print(f"    {name} {outcome}")
         
         # Final VRAM check
-        time.sleep(2)
         used_cleanup, free_cleanup = get_vram_usage()
         print(f"\n    Final VRAM after cleanup: {used_cleanup} MB used, {free_cleanup} MB free")
+        
+        sampler.stop()
+        sampler.dump('test_llm_vram_trace.json')
+        print(f"    VRAM trace ({len(sampler.samples)} samples) written to test_llm_vram_trace.json")
 
 
 if __name__ == "__main__":
-    success = test_llm_vram()
-    sys.exit(0 if success else 1)
+    sys.exit(pytest.main([__file__, "-s"]))
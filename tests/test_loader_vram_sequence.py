@@ -1,22 +1,65 @@
 #!/usr/bin/env python3
 """Test loader with VRAM monitoring - custom service startup order."""
+import os
+import re
 import sys
+import json
 import time
+import queue
+import threading
+import urllib.request
 import subprocess
 import signal
 from pathlib import Path
 from typing import Dict, Optional, List
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import psutil
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from common.health_client import HealthClient
-from common.vram_logger import get_vram_logger
+from common.net_utils import OLLAMA_PORT, OLLAMA_URL, ollama_up, port_open
+from common.proc_utils import stop_process_groups
+from common.vram_logger import get_vram_logger, NVML_AVAILABLE
 from tests.base_test import VRAMTestLogger
 import grpc
 from proto import services_pb2, services_pb2_grpc
 
+if NVML_AVAILABLE:
+    import pynvml as nvml
+
+OLLAMA_GENERATE_URL = f"{OLLAMA_URL}/api/generate"
+
+# Python opens files and sockets non-inheritable (PEP 446), so on Linux the
+# children need no close-everything scan of the fd table at spawn
+_CLOSE_FDS = sys.platform != 'linux'
+
+_RULE = '=' * 60
+
+# Summary table columns, kept in one place
+_HDR = "{s:<25} {u:>10} {d:>12} {t:>10}".format
+_ROW = "{stage:<25} {used:>10.0f} {delta:>+12.0f} {ts:>10.1f}".format
+
+# One VRAM reading: stage label, used MB, seconds since the test started
+VRAMRec = namedtuple('VRAMRec', 'stage used_mb ts')
+
+# Service scripts left behind by earlier runs
+_SVC_RE = re.compile(r'(?:kwd|stt|llm|tts|logger|loader)_service\.py')
+
+
+def _ollama_ready(deadline: float) -> bool:
+    """Wait until Ollama's port accepts connections and its API answers, or deadline passes."""
+    while not port_open(OLLAMA_PORT, timeout=0.2):
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+            
+    # The listener can be up before the HTTP server is serving requests
+    return ollama_up(timeout=2)
+
 
 class VRAMMonitoredLoader:
     """Loader that monitors VRAM usage at each service startup."""
@@ -28,6 +71,7 @@ class VRAMMonitoredLoader:
         self.vram_logger = get_vram_logger()
         
         self.processes = {}
+        self.ollama_process = None
         self.health_clients = {}
         self.start_time = time.time()
         
@@ -39,149 +83,250 @@ class VRAMMonitoredLoader:
             ('tts', 5006, 'services/tts_service.py'),
         ]
         
-        # Track VRAM usage
+        # Resolve the interpreter and service scripts once for every start
+        # Not resolve()d: following the symlink would reach the base interpreter
+        # and lose the venv's site-packages
+        venv_py = Path('.venv/bin/python').absolute()
+        if not venv_py.exists():
+            raise FileNotFoundError(f"Virtual environment interpreter not found: {venv_py}")
+        self._venv_py = str(venv_py)
+        self._script_paths = {
+            name: Path(script)
+            for name, _, script in self.service_order + [('logger', 5001, 'services/logger_service.py')]
+        }
+        self._missing_scripts = {name for name, path in self._script_paths.items() if not path.exists()}
+        
+        # Track VRAM usage; probe once so a machine without NVML skips every reading
         self.vram_history = []
+        self._vram_supported = self._read_vram() is not None
+        
+        # memory.log writes are handed to a background thread
+        self._log_q = queue.Queue()
+        self._log_thread = threading.Thread(target=self._log_worker, daemon=True)
+        self._log_thread.start()
+        
+        # Use PyTorch's expandable-segment allocator in every service so the
+        # VRAM figures are not inflated by reserved-but-unused fragments
+        self.service_env = os.environ.copy()
+        alloc_conf = self.service_env.get('PYTORCH_CUDA_ALLOC_CONF')
+        self.service_env['PYTORCH_CUDA_ALLOC_CONF'] = (
+            f"{alloc_conf},expandable_segments:True" if alloc_conf else "expandable_segments:True"
+        )
+        self.service_env['TORCH_NCCL_AVOID_RECORD_STREAMS'] = '1'
+        
+    def get_vram_info(self) -> Optional[Dict]:
+        """Get current VRAM information, or None where VRAM cannot be read."""
+        if not self._vram_supported:
+            return None
+        return self._read_vram()
+        
+    def _read_vram(self) -> Optional[Dict]:
+        """Read VRAM unconditionally; get_vram_info() skips this once it is known to fail."""
+        handle = self.vram_logger.handle if self.vram_logger.nvml_initialized else None
+        if handle is None:
+            return self.vram_logger.get_vram_info()
+        # Memory only, on the logger's cached handle; skips the per-process scan
+        try:
+            mem = nvml.nvmlDeviceGetMemoryInfo(handle)
+        except nvml.NVMLError:
+            return None
+        return {
+            'total_mb': mem.total / 1024 / 1024,
+            'used_mb': mem.used / 1024 / 1024,
+            'free_mb': mem.free / 1024 / 1024,
+            'percent': mem.used / mem.total * 100,
+        }
+        
+    def _wait_vram_stable(self, poll_s: float = 0.05, window: int = 3,
+                          tol_mb: float = 10, cap_s: float = 3.0) -> float:
+        """Wait until used VRAM settles within tol_mb over window samples, or cap_s passes.
         
-    def get_vram_info(self) -> Dict:
-        """Get current VRAM information."""
-        return self.vram_logger.get_vram_info()
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        recent = deque(maxlen=window)
+        while time.monotonic() - start < cap_s:
+            vram = self.get_vram_info()
+            if vram is None:
+                break
+            recent.append(vram['used_mb'])
+            if len(recent) == window and max(recent) - min(recent) < tol_mb:
+                break
+            time.sleep(poll_s)
+        elapsed = time.monotonic() - start
+        self.logger.info(f"VRAM stabilized in {elapsed*1000:.0f} ms")
+        return elapsed
         
-    def print_vram_status(self, stage: str):
-        """Print formatted VRAM status."""
-        vram = self.get_vram_info()
+    def _log_worker(self):
+        """Write queued VRAM snapshots to memory.log until the None sentinel arrives."""
+        while True:
+            batch = [self._log_q.get()]
+            # Drain whatever else is already waiting, up to 32 records
+            while len(batch) < 32:
+                try:
+                    batch.append(self._log_q.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    return
+                stage, service, vram = record
+                self.vram_logger.log_vram_status(event=stage, service=service, vram_info=vram)
+                
+    def print_vram_status(self, stage: str, vram: Optional[Dict] = None) -> Optional[Dict]:
+        """Print formatted VRAM status, taking a reading unless one is passed in.
+        
+        Returns:
+            The VRAM reading that was reported, or None if unavailable
+        """
+        if not self._vram_supported:
+            self.logger.info(f"{stage} (VRAM monitoring unavailable)")
+            return None
+        if vram is None:
+            vram = self.get_vram_info()
         if vram:
-            # Log to console and test log
-            self.logger.info(f"\n{'='*60}")
-            self.logger.info(f"VRAM Status - {stage}")
-            self.logger.info(f"{'='*60}")
-            self.logger.info(f"  Used:  {vram['used_mb']:>6.0f} MB ({vram['percent']:>5.1f}%)")
-            self.logger.info(f"  Free:  {vram['free_mb']:>6.0f} MB")
-            self.logger.info(f"  Total: {vram['total_mb']:>6.0f} MB")
-            self.logger.info(f"{'='*60}")
+            # Log to console and test log as one record
+            self.logger.info(
+                f"\n{_RULE}\nVRAM Status - {stage}\n{_RULE}\n"
+                f"  Used:  {vram['used_mb']:>6.0f} MB ({vram['percent']:>5.1f}%)\n"
+                f"  Free:  {vram['free_mb']:>6.0f} MB\n"
+                f"  Total: {vram['total_mb']:>6.0f} MB\n{_RULE}"
+            )
             
-            # Log to memory.log
-            self.vram_logger.log_vram_status(event=stage, service='loader_test')
+            # Log to memory.log from the worker thread, off the measurement path
+            self._log_q.put((stage, 'loader_test', vram))
             
             # Track history
-            self.vram_history.append({
-                'stage': stage,
-                'used_mb': vram['used_mb'],
-                'timestamp': time.time() - self.start_time
-            })
+            self.vram_history.append(VRAMRec(stage, vram['used_mb'], time.time() - self.start_time))
         else:
             self.logger.warning(f"Could not get VRAM info at {stage}")
+        return vram
             
-    def start_service(self, name: str, port: int, script: str) -> bool:
-        """Start a single service."""
+    def _spawn(self, name: str, port: int, script: str) -> Optional[subprocess.Popen]:
+        """Launch a service process without waiting for it to become healthy."""
         try:
             self.logger.info(f"Starting {name} service on port {port}...")
             
             # Check if already running
             if name in self.processes and self.processes[name].poll() is None:
                 self.logger.info(f"{name} service already running")
-                return True
+                return self.processes[name]
                 
             # Start the service
-            script_path = Path(script)
-            if not script_path.exists():
+            script_path = self._script_paths.get(name) or Path(script)
+            if name in self._missing_scripts:
                 self.logger.error(f"Script not found: {script_path}")
-                return False
+                return None
                 
-            # Use virtual environment Python
-            venv_python = Path('.venv/bin/python').absolute()
-            
             # Start process
-            process = subprocess.Popen(
-                [str(venv_python), str(script_path)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
+            self.logger.info(
+                f"{name} env: PYTORCH_CUDA_ALLOC_CONF={self.service_env['PYTORCH_CUDA_ALLOC_CONF']}"
             )
+            # Nothing reads service output live, so send it straight to a log
+            # file; an unread PIPE would block the service once it filled up
+            log_dir = Path('logs')
+            log_dir.mkdir(exist_ok=True)
+            with open(log_dir / f"{name}.log", 'wb') as log:
+                process = subprocess.Popen(
+                    [self._venv_py, str(script_path)],
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    env=self.service_env,
+                    start_new_session=True,  # Own process group, stopped as one in cleanup()
+                    close_fds=_CLOSE_FDS
+                )
             
             self.processes[name] = process
             self.logger.info(f"{name} process started (PID: {process.pid})")
+            return process
             
-            # Wait for service to be healthy
-            health_client = HealthClient(port=port)
-            self.health_clients[name] = health_client
-            
-            self.logger.info(f"Waiting for {name} service to be healthy...")
-            deadline = time.time() + 30  # 30 second timeout
+        except Exception as e:
+            self.logger.error(f"Error starting {name}: {e}")
+            return None
             
+    def _await_healthy(self, name: str, port: int, deadline: float) -> bool:
+        """Poll a service's health endpoint until it is SERVING or deadline passes."""
+        health_client = HealthClient(port=port)
+        self.health_clients[name] = health_client
+        
+        self.logger.info(f"Waiting for {name} service to be healthy...")
+        try:
             while time.time() < deadline:
                 status = health_client.check()
                 if status == "SERVING":
                     self.logger.info(f"{name} service is SERVING ✓")
                     return True
-                time.sleep(0.5)
-                
-            self.logger.error(f"{name} service health check timeout ✗")
+                time.sleep(0.1)
+        except Exception as e:
+            self.logger.error(f"Error checking {name}: {e}")
             return False
             
-        except Exception as e:
-            self.logger.error(f"Error starting {name}: {e}")
+        self.logger.error(f"{name} service health check timeout ✗")
+        return False
+            
+    def start_service(self, name: str, port: int, script: str) -> bool:
+        """Start a single service and wait for it to become healthy."""
+        if self._spawn(name, port, script) is None:
             return False
+        return self._await_healthy(name, port, time.time() + 30)  # 30 second timeout
             
     def kill_orphaned_services(self):
         """Kill any orphaned service processes."""
         self.logger.info("Killing any orphaned services...")
         
-        service_patterns = [
-            'kwd_service.py',
-            'stt_service.py', 
-            'llm_service.py',
-            'tts_service.py',
-            'logger_service.py',
-            'loader_service.py'
-        ]
-        
-        killed_count = 0
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+        # Collect matches first, then kill them in a single pass
+        orphans = []
+        for proc in psutil.process_iter():
             try:
-                cmdline = proc.info.get('cmdline', [])
+                with proc.oneshot():
+                    cmdline = proc.cmdline()
                 if cmdline:
-                    cmdline_str = ' '.join(cmdline)
-                    for pattern in service_patterns:
-                        if pattern in cmdline_str:
-                            proc.kill()
-                            killed_count += 1
-                            self.logger.info(f"  Killed {pattern} (PID: {proc.pid})")
-                            break
+                    match = _SVC_RE.search(' '.join(cmdline))
+                    if match:
+                        orphans.append((proc, match.group(0)))
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 pass
                 
+        killed = []
+        for proc, service in orphans:
+            try:
+                os.kill(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                continue
+            killed.append(proc)
+            self.logger.info(f"  Killed {service} (PID: {proc.pid})")
+                
         # Also kill Ollama
         subprocess.run(["pkill", "-f", "ollama"], capture_output=True)
         
-        if killed_count > 0:
-            self.logger.info(f"Killed {killed_count} orphaned service(s)")
-            time.sleep(2)  # Wait for GPU memory to be released
+        if killed:
+            self.logger.info(f"Killed {len(killed)} orphaned service(s)")
+            # Wait only until they are gone, so their GPU memory is released
+            psutil.wait_procs(killed, timeout=2)
             
     def start_ollama(self) -> bool:
         """Start Ollama server."""
         self.logger.info("Starting Ollama server...")
         
         # Check if already running
-        result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-        if result.returncode == 0:
+        if _ollama_ready(time.time() + 0.2):
             self.logger.info("Ollama already running")
             return True
             
         # Start Ollama
-        ollama_process = subprocess.Popen(
+        self.ollama_process = subprocess.Popen(
             ["ollama", "serve"],
             stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            close_fds=_CLOSE_FDS
         )
         
         # Wait for it to be ready
-        for i in range(10):
-            time.sleep(1)
-            result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-            if result.returncode == 0:
-                self.logger.info("Ollama server started successfully ✓")
-                return True
+        if _ollama_ready(time.time() + 10):
+            self.logger.info("Ollama server started successfully ✓")
+            return True
                 
         self.logger.error("Failed to start Ollama ✗")
         return False
@@ -191,6 +336,24 @@ class VRAMMonitoredLoader:
         self.logger.info("Pre-loading LLM model (llama3.1:8b-instruct-q4_K_M)...")
         self.logger.info("This may take a moment...")
         
+        # An empty prompt makes Ollama load the weights without generating anything
+        request = urllib.request.Request(
+            OLLAMA_GENERATE_URL,
+            data=json.dumps({
+                "model": "llama3.1:8b-instruct-q4_K_M",
+                "prompt": "",
+                "keep_alive": "30m"
+            }).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                if response.status == 200:
+                    self.logger.info("LLM model loaded successfully ✓")
+                    return True
+        except OSError as e:
+            self.logger.warning(f"Ollama API preload failed ({e}), falling back to CLI")
+            
         try:
             result = subprocess.run(
                 ["ollama", "run", "llama3.1:8b-instruct-q4_K_M", "hi"],
@@ -216,10 +379,12 @@ class VRAMMonitoredLoader:
             
     def run(self):
         """Run the loader test with VRAM monitoring."""
-        print("\n" + "="*60)
-        print("VRAM Monitored Loader Test")
-        print("Service Order: KWD → STT → LLM → TTS")
-        print("="*60)
+        self._banner(
+            "", _RULE,
+            "VRAM Monitored Loader Test",
+            "Service Order: Logger → Ollama → KWD + STT + LLM + TTS (concurrent)",
+            _RULE
+        )
         
         try:
             # Initial cleanup
@@ -234,6 +399,8 @@ class VRAMMonitoredLoader:
                 print("[LOGGER] ✗ Failed to start - aborting")
                 return False
                 
+            # Every "after" reading waits for allocations to settle first
+            self._wait_vram_stable()
             self.print_vram_status("After Logger")
             
             # Start Ollama for LLM
@@ -244,114 +411,154 @@ class VRAMMonitoredLoader:
             if not self.preload_llm_model():
                 print("[LLM] Warning: Could not pre-load model")
                 
-            self.print_vram_status("After LLM Model Load")
+            self._wait_vram_stable()
+            vram_loaded = self.print_vram_status("After LLM Model Load")
+            
+            # KWD/STT/LLM/TTS only depend on Logger and Ollama, so boot them together
+            self._banner(
+                "", _RULE,
+                "Starting " + ", ".join(name.upper() for name, _, _ in self.service_order) + " concurrently",
+                _RULE
+            )
             
-            # Start services in specified order
+            # Per-service deltas overlap with the other services' loads, so they
+            # are only a concurrent baseline, not an exact attribution
+            # The spawns below are back to back, so the post-load reading is
+            # every service's "before"
+            vram_before = {}
             for name, port, script in self.service_order:
-                print(f"\n{'='*60}")
-                print(f"Starting {name.upper()} Service")
-                print(f"{'='*60}")
-                
-                # VRAM before
-                vram_before = self.get_vram_info()
-                
-                # Start service
-                success = self.start_service(name, port, script)
-                
-                if not success:
+                vram_before[name] = vram_loaded
+                if self._spawn(name, port, script) is None:
                     print(f"\n[ERROR] Failed to start {name} service")
                     self.print_summary()
                     return False
                     
-                # Wait a bit for memory to stabilize
-                time.sleep(2)
-                
-                # VRAM after
-                vram_after = self.get_vram_info()
-                
-                # Calculate delta
-                if vram_before and vram_after:
-                    delta = vram_after['used_mb'] - vram_before['used_mb']
-                    print(f"\n[{name.upper()}] VRAM Delta: {delta:+.0f} MB")
+            failed = []
+            deadline = time.time() + 30
+            with ThreadPoolExecutor(max_workers=len(self.service_order)) as executor:
+                futures = {
+                    executor.submit(self._await_healthy, name, port, deadline): name
+                    for name, port, _ in self.service_order
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    if not future.result():
+                        failed.append(name)
+                        continue
+                        
+                    # VRAM after; the other services are still loading, so
+                    # this is not waited on to settle (one wait follows below)
+                    vram_after = self.get_vram_info()
+                    
+                    # Calculate delta
+                    if vram_before[name] and vram_after:
+                        delta = vram_after['used_mb'] - vram_before[name]['used_mb']
+                        print(f"\n[{name.upper()}] VRAM Delta: {delta:+.0f} MB (concurrent baseline)")
+                        
+                    self.print_vram_status(f"After {name.upper()}", vram_after)
                     
-                self.print_vram_status(f"After {name.upper()}")
+            if failed:
+                print(f"\n[ERROR] Failed to start {', '.join(failed)} service(s)")
+                self.print_summary()
+                return False
                 
+            # Wait once for memory to stabilize, now that every service is up
+            self._wait_vram_stable()
+            self.print_vram_status("All Services Running")
+            
             # Final summary
             self.print_summary()
             
             print("\n[SUCCESS] All services started successfully!")
             print("\nServices are running. Press Ctrl+C to stop...")
             
-            # Keep running until interrupted
-            while True:
-                time.sleep(1)
+            # Sleep until Ctrl+C without waking up periodically
+            done = threading.Event()
+            previous = signal.signal(signal.SIGINT, lambda *_: done.set())
+            try:
+                done.wait()
+            finally:
+                signal.signal(signal.SIGINT, previous)
+            print("\n[INTERRUPT] Stopping services...")
                 
         except KeyboardInterrupt:
             print("\n[INTERRUPT] Stopping services...")
         finally:
             self.cleanup()
             
+    @staticmethod
+    def _banner(*lines: str):
+        """Write a block of lines to stdout in one call."""
+        sys.stdout.write('\n'.join(lines) + '\n')
+        
     def print_summary(self):
         """Print VRAM usage summary."""
-        print("\n" + "="*60)
-        print("VRAM Usage Summary")
-        print("="*60)
+        self._banner("", _RULE, "VRAM Usage Summary", _RULE)
         
         if not self.vram_history:
             print("No VRAM history recorded")
             return
             
-        print(f"{'Stage':<25} {'VRAM (MB)':>10} {'Delta (MB)':>12} {'Time (s)':>10}")
-        print("-"*60)
-        
-        prev_vram = 0
-        for entry in self.vram_history:
-            delta = entry['used_mb'] - prev_vram if prev_vram > 0 else 0
-            print(f"{entry['stage']:<25} {entry['used_mb']:>10.0f} {delta:>+12.0f} {entry['timestamp']:>10.1f}")
-            prev_vram = entry['used_mb']
-            
-        print("-"*60)
+        # Row-to-row deltas in one pass; the first stage is the baseline
+        used = np.fromiter((rec.used_mb for rec in self.vram_history), dtype=np.float64)
+        deltas = np.diff(used, prepend=used[0])
+        self._banner(
+            f"Allocator: PYTORCH_CUDA_ALLOC_CONF={self.service_env['PYTORCH_CUDA_ALLOC_CONF']}",
+            _HDR(s='Stage', u='VRAM (MB)', d='Delta (MB)', t='Time (s)'),
+            "-"*60,
+            *(_ROW(stage=rec.stage, used=rec.used_mb, delta=delta, ts=rec.ts)
+              for rec, delta in zip(self.vram_history, deltas)),
+            "-"*60
+        )
         
         # Total usage
         if len(self.vram_history) >= 2:
-            total_delta = self.vram_history[-1]['used_mb'] - self.vram_history[0]['used_mb']
+            total_delta = used[-1] - used[0]
             print(f"{'Total VRAM Increase:':<25} {total_delta:>10.0f} MB")
             
         # Final status
         final_vram = self.get_vram_info()
         if final_vram:
-            print(f"{'Final VRAM Usage:':<25} {final_vram['used_mb']:>10.0f} MB ({final_vram['percent']:.1f}%)")
-            print(f"{'Final VRAM Free:':<25} {final_vram['free_mb']:>10.0f} MB")
+            self._banner(
+                f"{'Final VRAM Usage:':<25} {final_vram['used_mb']:>10.0f} MB ({final_vram['percent']:.1f}%)",
+                f"{'Final VRAM Free:':<25} {final_vram['free_mb']:>10.0f} MB"
+            )
             
     def cleanup(self):
         """Clean up all processes."""
         print("\n[CLEANUP] Stopping all services...")
         
-        # Stop all processes
-        for name, process in self.processes.items():
-            if process and process.poll() is None:
-                process.terminate()
-                print(f"  Stopped {name} (PID: {process.pid})")
-                
-        # Wait for processes to terminate
-        time.sleep(1)
-        
-        # Force kill if needed
-        for name, process in self.processes.items():
-            if process and process.poll() is None:
-                process.kill()
+        running = dict(self.processes)
+        if self.ollama_process is not None:
+            running['ollama'] = self.ollama_process
+            
+        def report(name, outcome):
+            pid = running[name].pid
+            if outcome == 'stopped':
+                print(f"  Stopped {name} (PID: {pid})")
+            elif outcome == 'killed':
                 print(f"  Force killed {name}")
+            else:
+                print(f"  {name} (PID: {pid}) did not exit")
+                
+        # Each process leads its own session, so one signal per group also
+        # reaches any workers it forked; services are reported as they exit
+        stop_process_groups(running, grace=1.0, report=report)
                 
         # Close health clients
         for client in self.health_clients.values():
             client.close()
             
-        # Kill Ollama
-        subprocess.run(["pkill", "-f", "ollama"], capture_output=True)
+        # Flush pending memory.log records
+        self._log_q.put(None)
+        self._log_thread.join(timeout=2)
+            
+        # Kill an Ollama we did not start ourselves
+        if self.ollama_process is None:
+            subprocess.run(["pkill", "-f", "ollama"], capture_output=True)
         
         print("[CLEANUP] Complete")
 
-
 if __name__ == "__main__":
     # Make sure we're in virtual environment
     if not Path('.venv').exists():
@@ -3,21 +3,59 @@
 
 import sys
 import time
+import re
+import json
 import subprocess
+import http.client
 from pathlib import Path
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from common.vram_logger import read_vram_mb
+
+MODEL = "llama3.1:8b-instruct-q4_K_M"
+
+# SYSTEM """...""" block in the Modelfile
+_SYSTEM_RE = re.compile(r'SYSTEM\s+"""(.*?)"""', re.DOTALL)
+
+class OllamaClient:
+    """Minimal Ollama REST client over one persistent HTTP connection."""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 11434, timeout: float = 60):
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    
+    def _request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # Drop the broken connection; the next request reconnects
+            self.conn.close()
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"Ollama {path} returned {response.status}: {data[:200]!r}")
+        return json.loads(data)
+    
+    def tags(self):
+        """List locally available models."""
+        return self._request("GET", "/api/tags")
+    
+    def generate(self, prompt: str, model: str = MODEL, keep_alive: str = "10m") -> str:
+        """Run a non-streaming completion, keeping the model resident afterwards."""
+        body = {"model": model, "prompt": prompt, "stream": False, "keep_alive": keep_alive}
+        return self._request("POST", "/api/generate", body)["response"]
+    
+    def close(self):
+        self.conn.close()
+
 
 def get_vram_usage():
-    """Get current VRAM usage in MB."""
-    result = subprocess.run(
-        ["nvidia-smi", "--query-gpu=memory.used,memory.free", "--format=csv,noheader,nounits"],
-        capture_output=True,
-        text=True
-    )
-    if result.returncode == 0:
-        used, free = result.stdout.strip().split(', ')
-        return int(used.strip()), int(free.strip())
-    return 0, 0
+    """Get current VRAM usage in MB as (used, free)."""
+    return read_vram_mb() or (0, 0)
 
 
 def test_ollama_vram():
@@ -28,6 +66,7 @@ def test_ollama_vram():
     print("="*80)
     
     ollama_process = None
+    client = OllamaClient()
     
     try:
         # Clean up
@@ -49,12 +88,14 @@ def test_ollama_vram():
         )
         
         # Wait for ready
-        for i in range(10):
-            time.sleep(1)
-            result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-            if result.returncode == 0:
-                print("   ✓ Ollama server ready")
-                break
+        for i in range(50):
+            try:
+                client.tags()
+            except OSError:
+                time.sleep(0.2)
+                continue
+            print("   ✓ Ollama server ready")
+            break
         
         # VRAM after Ollama
         used_ollama, free_ollama = get_vram_usage()
@@ -64,15 +105,11 @@ def test_ollama_vram():
         print("\n5. Loading llama3.1:8b-instruct-q4_K_M model...")
         print("   First inference to load model into VRAM...")
         start_time = time.time()
-        result = subprocess.run(
-            ["ollama", "run", "llama3.1:8b-instruct-q4_K_M", "Say hello"],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        # Pin the model in VRAM for the rest of the test
+        response = client.generate("Say hello", keep_alive="30m")
         load_time = time.time() - start_time
         print(f"   Model loaded in {load_time:.1f}s")
-        print(f"   Response: {result.stdout.strip()}")
+        print(f"   Response: {response.strip()}")
         
         # VRAM after model load
         used_model, free_model = get_vram_usage()
@@ -84,11 +121,10 @@ def test_ollama_vram():
         print("\n7. Testing with system prompt from Modelfile...")
         modelfile_path = Path("config/Modelfile")
         if modelfile_path.exists():
-            content = modelfile_path.read_text()
-            if 'SYSTEM """' in content:
-                start = content.index('SYSTEM """') + len('SYSTEM """')
-                end = content.index('"""', start)
-                system_prompt = content[start:end].strip()
+            content = modelfile_path.read_bytes().decode('utf-8', 'replace')
+            match = _SYSTEM_RE.search(content)
+            if match:
+                system_prompt = match.group(1).strip()
                 print(f"   System prompt: {len(system_prompt)} chars")
                 print(f"   First line: {system_prompt.split(chr(10))[0][:80]}...")
         
@@ -104,14 +140,8 @@ def test_ollama_vram():
         for name, prompt in test_prompts:
             print(f"\n   {name} prompt: '{prompt}'")
             start_time = time.time()
-            result = subprocess.run(
-                ["ollama", "run", "llama3.1:8b-instruct-q4_K_M", prompt],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            response = client.generate(prompt).strip()
             inference_time = time.time() - start_time
-            response = result.stdout.strip()
             
             # Measure VRAM during inference
             used_inference, free_inference = get_vram_usage()
@@ -160,6 +190,7 @@ def test_ollama_vram():
     finally:
         # Cleanup
         print("\n9. Cleaning up...")
+        client.close()
         if ollama_process:
             ollama_process.terminate()
             try:
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Test client for STT service."""
 import sys
+import atexit
 from pathlib import Path
 import grpc
 import time
@@ -12,6 +13,29 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
 
+# One channel to the STT service for every test and turn; grpc connects lazily,
+# and it is only closed at interpreter exit
+_CHANNEL = grpc.insecure_channel(
+    '127.0.0.1:5004',
+    options=[
+        ('grpc.keepalive_time_ms', 10000),
+        ('grpc.max_receive_message_length', -1),
+    ]
+)
+_STUB = services_pb2_grpc.SttServiceStub(_CHANNEL)
+atexit.register(_CHANNEL.close)
+
+_channel_ready = False
+
+
+def get_stub(timeout=5):
+    """Return the shared STT stub, waiting for the channel to connect the first time."""
+    global _channel_ready
+    if not _channel_ready:
+        grpc.channel_ready_future(_CHANNEL).result(timeout=timeout)
+        _channel_ready = True
+    return _STUB
+
 
 def test_stt_service():
     """Test STT service functionality."""
@@ -29,8 +53,7 @@ def test_stt_service():
         return False
     
     # Connect to STT service
-    channel = grpc.insecure_channel('127.0.0.1:5004')
-    stub = services_pb2_grpc.SttServiceStub(channel)
+    stub = get_stub()
     
     # Create a dialog ID
     dialog_id = f"test_{uuid.uuid4().hex[:8]}"
@@ -62,9 +85,13 @@ def test_stt_service():
         )
         results_stream = stub.Results(dialog_ref)
         
-        # Wait for result
+        # Wait for result; the HH:MM:SS label only changes once a second
+        last_sec, timestamp = None, ''
         for result in results_stream:
-            timestamp = time.strftime('%H:%M:%S', time.localtime(result.timestamp_ms / 1000))
+            sec = result.timestamp_ms // 1000
+            if sec != last_sec:
+                last_sec = sec
+                timestamp = time.strftime('%H:%M:%S', time.localtime(sec))
             
             if result.final:
                 print(f"\n[{timestamp}] FINAL TRANSCRIPTION:")
@@ -86,7 +113,6 @@ def test_stt_service():
         response = stub.Stop(stop_request)
         print(f"Stop: {response.message}")
         
-        channel.close()
         health_client.close()
     
     print("\nTest complete!")
@@ -98,8 +124,7 @@ def test_continuous_recognition():
     print("Testing Continuous Recognition...")
     
     # Connect to STT service
-    channel = grpc.insecure_channel('127.0.0.1:5004')
-    stub = services_pb2_grpc.SttServiceStub(channel)
+    stub = get_stub()
     
     dialog_id = f"continuous_{uuid.uuid4().hex[:8]}"
     
@@ -136,8 +161,6 @@ def test_continuous_recognition():
     
     except KeyboardInterrupt:
         print("\nStopped by user")
-    finally:
-        channel.close()
     
     print("\nContinuous test complete!")
 
@@ -2,10 +2,9 @@
 """Interactive STT test - speak and see transcription in real-time."""
 
 import sys
-import time
 import grpc
-import threading
-import subprocess
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add directories to path
@@ -13,93 +12,62 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
+from common.proc_utils import kill_by_name, wait_pid
+from common.log_utils import follow
+from zygote import launch
 
+# Command lines of the services this test starts
+_SERVICES_RE = r"stt_service\.py|logger_service\.py"
 
-def test_stt_interactive():
-    """Test STT service with interactive recording and transcription."""
-    
-    print("\n" + "="*80)
-    print("INTERACTIVE STT SERVICE TEST")
-    print("="*80)
-    
-    stt_process = None
-    logger_process = None
-    
+
+async def ainput(prompt: str = '') -> str:
+    """Read a line from stdin without blocking the event loop."""
+    print(prompt, end='', flush=True)
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+    fd = sys.stdin.fileno()
+    loop.add_reader(fd, lambda: line.done() or line.set_result(sys.stdin.readline()))
     try:
-        # Clean up any existing services
-        print("\n1. Cleaning up existing services...")
-        subprocess.run(["pkill", "-f", "stt_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        time.sleep(2)
-        
-        # Start Logger service (required by STT)
-        print("\n2. Starting Logger service...")
-        venv_python = Path('.venv/bin/python').absolute()
-        logger_log = open('logger_service.log', 'w')
-        logger_process = subprocess.Popen(
-            [str(venv_python), 'services/logger/logger_service.py'],
-            stdout=logger_log,
-            stderr=subprocess.STDOUT
-        )
-        
-        # Wait for Logger to be ready
-        time.sleep(2)
-        logger_health = HealthClient(port=5001)
-        for i in range(10):
-            if logger_health.check() == "SERVING":
-                print("   ✓ Logger service ready")
-                break
-            time.sleep(1)
-        
-        # Start STT service
-        print("\n3. Starting STT service (Whisper)...")
-        print("   Loading Whisper model - this may take a moment...")
-        stt_log = open('stt_service.log', 'w')
-        stt_process = subprocess.Popen(
-            [str(venv_python), 'services/stt/stt_service.py'],
-            stdout=stt_log,
-            stderr=subprocess.STDOUT
-        )
-        
-        # Wait for STT to be ready
-        print("   Waiting for STT service to be ready...")
-        stt_health = HealthClient(port=5004)
-        for i in range(30):
-            status = stt_health.check()
-            if status == "SERVING":
-                print("   ✓ STT service ready")
-                break
-            elif i % 5 == 0:
-                print(f"   Still loading... ({i}s)")
-            time.sleep(1)
-        else:
-            print("   ✗ STT service failed to start")
-            # Check log for errors
-            with open('stt_service.log', 'r') as f:
-                print("\nLast lines from STT log:")
-                for line in f.readlines()[-20:]:
-                    print(f"  {line.strip()}")
-            return False
-        
-        # Connect to STT service
-        print("\n4. Connecting to STT service...")
-        channel = grpc.insecure_channel('127.0.0.1:5004')
+        text = await line
+    finally:
+        loop.remove_reader(fd)
+    if not text:
+        raise EOFError
+    return text.rstrip('\n')
+
+
+async def listen_for_results(stt_stub, dialog_id):
+    """Stream one turn's STT results, returning the final text or None."""
+    dialog_ref = services_pb2.DialogRef(
+        dialog_id=dialog_id,
+        turn_number=1
+    )
+    # Partials arrive several times a second; write them as raw bytes, with
+    # \x1b[K clearing whatever a longer previous partial left on the line
+    sys.stdout.flush()  # Keep earlier print() output ahead of our raw writes
+    _write = sys.stdout.buffer.write
+    _flush = sys.stdout.buffer.flush
+    try:
+        async for result in stt_stub.Results(dialog_ref):
+            if result.final:
+                print(f"\n📝 Final transcription: \"{result.text}\"")
+                return result.text
+            # Show partial results
+            _write(b"\r   Partial: " + result.text.encode() + b"\x1b[K")
+            _flush()
+    except grpc.RpcError as e:
+        print(f"\n✗ Error listening for results: {e}")
+    return None
+
+
+async def run_turns(stt_log):
+    """Run record/transcribe turns until 'quit', all on one event loop and channel."""
+    async with grpc.aio.insecure_channel('127.0.0.1:5004') as channel:
         stt_stub = services_pb2_grpc.SttServiceStub(channel)
         
-        # Test loop
-        print("\n" + "="*80)
-        print("READY FOR TESTING")
-        print("="*80)
-        print("\nInstructions:")
-        print("  1. Press ENTER to start recording")
-        print("  2. Speak clearly into your microphone")
-        print("  3. Press ENTER again to stop recording")
-        print("  4. See the transcription")
-        print("  5. Type 'quit' to exit\n")
-        
         test_num = 0
         while True:
-            user_input = input("\n[Press ENTER to start recording, or 'quit' to exit]: ")
+            user_input = await ainput("\n[Press ENTER to start recording, or 'quit' to exit]: ")
             if user_input.lower() == 'quit':
                 break
             
@@ -112,7 +80,7 @@ def test_stt_interactive():
             print("🎤 RECORDING - Speak now...")
             print("   (Press ENTER when done speaking)")
             
-            start_response = stt_stub.Start(services_pb2.StartRequest(
+            start_response = await stt_stub.Start(services_pb2.StartRequest(
                 dialog_id=dialog_id,
                 turn_number=1
             ))
@@ -121,72 +89,98 @@ def test_stt_interactive():
                 print(f"✗ Failed to start recording: {start_response.message}")
                 continue
             
-            # Create a thread to listen for results
-            transcription_result = {'text': '', 'final': False}
-            stop_listening = threading.Event()
-            
-            def listen_for_results():
-                """Listen for STT results in background."""
-                try:
-                    dialog_ref = services_pb2.DialogRef(
-                        dialog_id=dialog_id,
-                        turn_number=1
-                    )
-                    
-                    for result in stt_stub.Results(dialog_ref):
-                        if stop_listening.is_set():
-                            break
-                            
-                        if result.final:
-                            transcription_result['text'] = result.text
-                            transcription_result['final'] = True
-                            print(f"\n📝 Final transcription: \"{result.text}\"")
-                            break
-                        else:
-                            # Show partial results
-                            print(f"\r   Partial: {result.text}", end='', flush=True)
-                            
-                except Exception as e:
-                    print(f"\n✗ Error listening for results: {e}")
-            
-            # Start listening thread
-            listener_thread = threading.Thread(target=listen_for_results, daemon=True)
-            listener_thread.start()
+            # Listen for results while waiting for the user
+            listener = asyncio.create_task(listen_for_results(stt_stub, dialog_id))
             
             # Wait for user to stop recording
-            input()  # Wait for ENTER press
+            await ainput()  # Wait for ENTER press
             
             # Stop recording
             print("\n⏹️  Stopping recording...")
-            stop_response = stt_stub.Stop(services_pb2.StopRequest(
+            stop_response = await stt_stub.Stop(services_pb2.StopRequest(
                 dialog_id=dialog_id
             ))
             
             if not stop_response.success:
                 print(f"✗ Failed to stop recording: {stop_response.message}")
             
-            # Wait for final transcription
-            timeout = 5
-            start_wait = time.time()
-            while not transcription_result['final'] and (time.time() - start_wait) < timeout:
-                time.sleep(0.1)
-            
-            # Stop the listener thread
-            stop_listening.set()
-            listener_thread.join(timeout=1)
+            # Wait for final transcription; a timeout cancels the listener
+            try:
+                text = await asyncio.wait_for(listener, timeout=5)
+            except asyncio.TimeoutError:
+                text = None
             
-            if transcription_result['final']:
+            if text is not None:
                 print(f"\n✓ Transcription complete!")
-                print(f"  Text: \"{transcription_result['text']}\"")
-                print(f"  Length: {len(transcription_result['text'])} characters")
+                print(f"  Text: \"{text}\"")
+                print(f"  Length: {len(text)} characters")
             else:
                 print("\n✗ No transcription received (timeout)")
-                print("\nChecking STT service log...")
-                with open('stt_service.log', 'r') as f:
-                    lines = f.readlines()
-                    print("Last 10 lines from STT log:")
-                    for line in lines[-10:]:
-                        print(f"  {line.strip()}")
+                print("\nLast 10 lines from STT log:")
+                for line in list(stt_log)[-10:]:
+                    print(f"  {line.strip()}")
+
+
+def test_stt_interactive():
+    """Test STT service with interactive recording and transcription."""
+    
+    print("\n" + "="*80)
+    print("INTERACTIVE STT SERVICE TEST")
+    print("="*80)
+    
+    stt_process = None
+    logger_process = None
+    stt_log = ()
+    
+    try:
+        # Clean up any existing services
+        print("\n1. Cleaning up existing services...")
+        kill_by_name(_SERVICES_RE)
+        
+        # Start Logger (required by STT) and STT together; Whisper's model
+        # load dominates, so the logger comes up inside that window
+        print("\n2. Starting Logger service...")
+        logger_process = launch('services/logger/logger_service.py', 'logger_service.log')
+        print("\n3. Starting STT service (Whisper)...")
+        print("   Loading Whisper model - this may take a moment...")
+        stt_process = launch('services/stt/stt_service.py')
+        stt_log = follow(stt_process.stdout)  # Last 100 lines, kept in memory for failure reports
+        
+        # Wait for both to be ready
+        print("   Waiting for Logger and STT services to be ready...")
+        logger_health = HealthClient(port=5001)
+        stt_health = HealthClient(port=5004)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            logger_ready = pool.submit(logger_health.wait_for_serving, timeout=12, check_interval=0.05)
+            stt_ready = pool.submit(stt_health.wait_for_serving, timeout=30, check_interval=0.2)
+            
+            if logger_ready.result():
+                print("   ✓ Logger service ready")
+            if stt_ready.result():
+                print("   ✓ STT service ready")
+            else:
+                print("   ✗ STT service failed to start")
+                # Check log for errors
+                print("\nLast lines from STT log:")
+                for line in list(stt_log)[-20:]:
+                    print(f"  {line.strip()}")
+                return False
+        
+        # Connect to STT service
+        print("\n4. Connecting to STT service...")
+        
+        # Test loop
+        print("\n" + "="*80)
+        print("READY FOR TESTING")
+        print("="*80)
+        print("\nInstructions:")
+        print("  1. Press ENTER to start recording")
+        print("  2. Speak clearly into your microphone")
+        print("  3. Press ENTER again to stop recording")
+        print("  4. See the transcription")
+        print("  5. Type 'quit' to exit\n")
+        
+        asyncio.run(run_turns(stt_log))
         
         print("\n" + "="*80)
         print("Test completed!")
@@ -202,11 +196,10 @@ def test_stt_interactive():
         traceback.print_exc()
         
         # Show STT log on error
-        if Path('stt_service.log').exists():
+        if stt_log:
             print("\nSTT service log:")
-            with open('stt_service.log', 'r') as f:
-                for line in f.readlines()[-20:]:
-                    print(f"  {line.strip()}")
+            for line in list(stt_log)[-20:]:
+                print(f"  {line.strip()}")
         
         return False
         
@@ -216,20 +209,19 @@ def test_stt_interactive():
         
         if stt_process:
             stt_process.terminate()
-            try:
-                stt_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
+            if not wait_pid(stt_process.pid, 2):
                 stt_process.kill()
+                wait_pid(stt_process.pid, 1)
+            stt_process.poll()  # Reap it
         
         if logger_process:
             logger_process.terminate()
-            try:
-                logger_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
+            if not wait_pid(logger_process.pid, 2):
                 logger_process.kill()
+                wait_pid(logger_process.pid, 1)
+            logger_process.poll()  # Reap it
         
-        subprocess.run(["pkill", "-f", "stt_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
+        kill_by_name(_SERVICES_RE)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """Test client for TTS service."""
 import sys
+import asyncio
+import contextlib
 from pathlib import Path
 import grpc
 import time
 import uuid
-import threading
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -13,146 +14,163 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
 
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+]
 
-def test_tts_speak():
-    """Test TTS Speak (unary) functionality."""
+
+@contextlib.asynccontextmanager
+async def _tts_channel(channel=None):
+    """Yield the shared TTS channel if one is given, else open one for this test only."""
+    if channel is not None:
+        yield channel
+    else:
+        async with grpc.aio.insecure_channel('127.0.0.1:5006', options=CHANNEL_OPTIONS) as owned:
+            yield owned
+
+
+async def _speak_async(channel=None):
+    """Test TTS speech for a batch of phrases sent over one stream."""
     print("Testing TTS Service - Speak...")
-    
+
     # Check health first
     health_client = HealthClient(port=5006)
     print("\nChecking health status...")
-    
-    # Wait for service to be ready
-    if health_client.wait_for_serving(timeout=10):
+
+    # Wait for service to be ready, off the event loop
+    if await asyncio.to_thread(health_client.wait_for_serving, timeout=10):
         print("✓ TTS service is SERVING")
     else:
         print("✗ TTS service is not ready")
+        health_client.close()
         return False
-    
-    # Connect to TTS service
-    channel = grpc.insecure_channel('127.0.0.1:5006')
-    stub = services_pb2_grpc.TtsServiceStub(channel)
-    
+
     # Create a dialog ID
     dialog_id = f"test_{uuid.uuid4().hex[:8]}"
     print(f"\nDialog ID: {dialog_id}")
-    
+
     # Test phrases
     test_phrases = [
         "Hi, Master!",
         "Hello! How can I help you today?",
         "The quick brown fox jumps over the lazy dog."
     ]
-    
-    try:
+
+    def generate_phrases():
+        """Yield every test phrase on one stream, then EOT."""
         for i, text in enumerate(test_phrases, 1):
             print(f"\nTest {i}: {text}")
-            
-            # Call Speak
-            request = services_pb2.SpeakRequest(
-                text=text,
-                dialog_id=dialog_id,
-                voice="af_heart"
+            yield services_pb2.LlmChunk(
+                text=text + " ",
+                eot=False,
+                dialog_id=dialog_id
             )
-            
-            response = stub.Speak(request)
-            
-            if response.success:
-                print(f"✓ Success: {response.message}")
-                print(f"  Duration: {response.duration_ms:.0f}ms")
-            else:
-                print(f"✗ Failed: {response.message}")
-                
-            # Wait between tests
-            time.sleep(2)
-            
+
+        yield services_pb2.LlmChunk(
+            text="",
+            eot=True,
+            dialog_id=dialog_id
+        )
+
+    try:
+        async with _tts_channel(channel) as chan:
+            stub = services_pb2_grpc.TtsServiceStub(chan)
+
+            # One stream for all phrases; the service queues their audio in order
+            response = await stub.SpeakStream(generate_phrases())
+
+        if response.success:
+            print(f"✓ Success: {response.message}")
+            print(f"  Duration: {response.duration_ms:.0f}ms")
+        else:
+            print(f"✗ Failed: {response.message}")
+
     except grpc.RpcError as e:
         print(f"RPC error: {e}")
         return False
     finally:
-        channel.close()
         health_client.close()
-    
+
     print("\nSpeak test complete!")
     return True
 
 
-def test_playback_events():
+async def _playback_events_async(channel=None):
     """Test PlaybackEvents streaming."""
     print("\nTesting PlaybackEvents...")
-    
-    # Connect to TTS service
-    channel = grpc.insecure_channel('127.0.0.1:5006')
-    stub = services_pb2_grpc.TtsServiceStub(channel)
-    
+
     dialog_id = f"events_{uuid.uuid4().hex[:8]}"
-    
-    # Start event listener in background
+
     events = []
-    
-    def listen_events():
+
+    async def listen_events(stub):
         try:
             dialog_ref = services_pb2.DialogRef(
                 dialog_id=dialog_id,
                 turn_number=1
             )
-            
-            for event in stub.PlaybackEvents(dialog_ref):
+
+            async for event in stub.PlaybackEvents(dialog_ref):
                 timestamp = time.strftime('%H:%M:%S', time.localtime(event.timestamp_ms / 1000))
                 print(f"  Event: {event.event_type} at {timestamp} (chunk {event.chunk_number})")
                 events.append(event)
-                
+
                 if event.event_type == "finished":
                     break
-                    
+
         except grpc.RpcError as e:
             print(f"Events error: {e}")
-            
-    # Start listener thread
-    listener = threading.Thread(target=listen_events, daemon=True)
-    listener.start()
-    
-    # Give it time to subscribe
-    time.sleep(0.5)
-    
-    # Trigger speak
-    print(f"Speaking with dialog {dialog_id}...")
-    request = services_pb2.SpeakRequest(
-        text="This is a test of playback events.",
-        dialog_id=dialog_id,
-        voice="af_heart"
-    )
-    
-    response = stub.Speak(request)
-    
-    # Wait for events
-    listener.join(timeout=5)
-    
+
+    async with _tts_channel(channel) as chan:
+        stub = services_pb2_grpc.TtsServiceStub(chan)
+
+        # Start event listener in background
+        listener = asyncio.create_task(listen_events(stub))
+
+        # Give it time to subscribe
+        await asyncio.sleep(0.5)
+
+        # Trigger speak
+        print(f"Speaking with dialog {dialog_id}...")
+        request = services_pb2.SpeakRequest(
+            text="This is a test of playback events.",
+            dialog_id=dialog_id,
+            voice="af_heart"
+        )
+
+        response = await stub.Speak(request)
+
+        # Wait for events
+        try:
+            await asyncio.wait_for(listener, timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
     print(f"Received {len(events)} events")
-    channel.close()
-    
+
     return len(events) > 0
 
 
-def test_speak_stream():
-    """Test SpeakStream (client-streaming) functionality."""
+async def _speak_stream_async(channel=None, delay=0.0):
+    """Test SpeakStream (client-streaming) functionality.
+
+    Args:
+        channel: Shared aio channel to the TTS service (one is opened if omitted)
+        delay: Seconds to pause between chunks to mimic LLM token pacing (0 sends them back to back)
+    """
     print("\nTesting TTS Service - SpeakStream...")
-    
-    # Connect to TTS service
-    channel = grpc.insecure_channel('127.0.0.1:5006')
-    stub = services_pb2_grpc.TtsServiceStub(channel)
-    
+
     dialog_id = f"stream_{uuid.uuid4().hex[:8]}"
-    
-    # Simulate LLM chunks
+
+    # Simulate LLM chunks; short fragments are pre-joined so each message carries a phrase
     chunks = [
-        "Hello! ",
-        "I'm your voice assistant. ",
-        "How can I ",
-        "help you today?"
+        "Hello! I'm your voice assistant. ",
+        "How can I help you today?"
     ]
-    
-    def generate_chunks():
+
+    async def generate_chunks():
         """Generate stream of chunks."""
         for i, text in enumerate(chunks):
             yield services_pb2.LlmChunk(
@@ -160,43 +178,69 @@ def test_speak_stream():
                 eot=False,
                 dialog_id=dialog_id
             )
-            time.sleep(0.2)  # Simulate LLM delay
-            
+            if delay:
+                await asyncio.sleep(delay)  # Simulate LLM delay
+
         # Send EOT
         yield services_pb2.LlmChunk(
             text="",
             eot=True,
             dialog_id=dialog_id
         )
-        
+
     try:
         print(f"Streaming {len(chunks)} chunks...")
         start_time = time.time()
-        
-        response = stub.SpeakStream(generate_chunks())
-        
+
+        async with _tts_channel(channel) as chan:
+            stub = services_pb2_grpc.TtsServiceStub(chan)
+            response = await stub.SpeakStream(generate_chunks())
+
         elapsed = (time.time() - start_time) * 1000
-        
+
         if response.success:
             print(f"✓ Success: {response.message}")
             print(f"  Total duration: {response.duration_ms:.0f}ms")
             print(f"  Elapsed time: {elapsed:.0f}ms")
         else:
             print(f"✗ Failed: {response.message}")
-            
+
     except grpc.RpcError as e:
         print(f"RPC error: {e}")
         return False
-    finally:
-        channel.close()
-        
+
     print("\nSpeakStream test complete!")
     return True
 
 
+def test_tts_speak():
+    """Test TTS speech for a batch of phrases sent over one stream."""
+    return asyncio.run(_speak_async())
+
+
+def test_playback_events():
+    """Test PlaybackEvents streaming."""
+    return asyncio.run(_playback_events_async())
+
+
+def test_speak_stream(delay=0.0):
+    """Test SpeakStream (client-streaming) functionality."""
+    return asyncio.run(_speak_stream_async(delay=delay))
+
+
+async def run_all(delay=0.0):
+    """Run every TTS test concurrently over one channel; they use separate dialog IDs."""
+    async with _tts_channel() as channel:
+        return await asyncio.gather(
+            _speak_async(channel),
+            _playback_events_async(channel),
+            _speak_stream_async(channel, delay)
+        )
+
+
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Test TTS service')
     parser.add_argument('--events', action='store_true',
                         help='Test playback events')
@@ -204,16 +248,17 @@ if __name__ == "__main__":
                         help='Test streaming mode')
     parser.add_argument('--all', action='store_true',
                         help='Run all tests')
-    
+    parser.add_argument('--simulate-llm', dest='simulate_llm_delay', type=float, nargs='?',
+                        const=0.2, default=0.0, metavar='SECONDS',
+                        help='Pause between streamed chunks like an LLM would (default 0.2s when given)')
+
     args = parser.parse_args()
-    
+
     if args.all:
-        test_tts_speak()
-        test_playback_events()
-        test_speak_stream()
+        asyncio.run(run_all(args.simulate_llm_delay))
     elif args.events:
         test_playback_events()
     elif args.stream:
-        test_speak_stream()
+        test_speak_stream(delay=args.simulate_llm_delay)
     else:
         test_tts_speak()
@@ -3,11 +3,10 @@
 
 import sys
 import time
-import subprocess
 import grpc
-import numpy as np
-import sounddevice as sd
-import soundfile as sf
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add directories to path
@@ -15,10 +14,55 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from proto import services_pb2, services_pb2_grpc
 from common.health_client import HealthClient
+from common.proc_utils import kill_by_name, wait_pid
+from common.log_utils import follow
+from zygote import launch
 
+# Command lines of the services this test starts
+_SERVICES_RE = r"tts_service\.py|logger_service\.py"
 
-def test_tts_with_audio():
-    """Test TTS service and play the generated audio."""
+# Target time for a relaunched TTS service to be SERVING with --warm; reported,
+# not enforced, since Kokoro is still rebuilt through KPipeline on every start
+WARM_READY_BUDGET_S = 2.0
+
+
+@contextlib.contextmanager
+def playback_finished(stub, dialog_id):
+    """Watch a dialog's PlaybackEvents, yielding an Event set on "finished".
+    
+    The events call is opened before the caller's Speak so the "finished"
+    event cannot be missed; it is cancelled on exit.
+    """
+    finished = threading.Event()
+    events = stub.PlaybackEvents(services_pb2.DialogRef(
+        dialog_id=dialog_id,
+        turn_number=1
+    ))
+    
+    def watch():
+        try:
+            for event in events:
+                if event.event_type == "finished":
+                    finished.set()
+                    break
+        except grpc.RpcError:
+            pass  # Cancelled on exit, or the service went away
+    
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield finished
+    finally:
+        events.cancel()
+        watcher.join(timeout=1)
+
+
+def test_tts_with_audio(warm=False):
+    """Test TTS service and play the generated audio.
+    
+    Args:
+        warm: Restart TTS after a first synthesis and report its relaunch time against WARM_READY_BUDGET_S
+    """
     
     test_text = """Test successful. Ya-da ya-da. Great! The TTS service is working now! 
     I can see it's downloading the Kokoro model and required dependencies. 
@@ -30,115 +74,117 @@ def test_tts_with_audio():
     
     logger_process = None
     tts_process = None
+    tts_log = ()
+    passed = False
     
     try:
         # Kill any existing services
         print("\n1. Cleaning up existing services...")
-        subprocess.run(["pkill", "-f", "tts_service.py"], capture_output=True)
-        subprocess.run(["pkill", "-f", "logger_service.py"], capture_output=True)
-        time.sleep(1)
+        kill_by_name(_SERVICES_RE)
         
-        # Start logger service (TTS dependency)
+        # Start logger (TTS dependency) and TTS together; the Kokoro model
+        # load dominates, so the logger comes up inside that window
         print("\n2. Starting logger service...")
-        venv_python = Path('.venv/bin/python').absolute()
-        logger_script = Path('services/logger/logger_service.py').absolute()
-        
-        logger_log = open('test_logger.log', 'w')
-        logger_process = subprocess.Popen(
-            [str(venv_python), str(logger_script)],
-            stdout=logger_log,
-            stderr=subprocess.STDOUT
-        )
+        logger_process = launch('services/logger/logger_service.py', 'test_logger.log')
         print(f"   Logger started with PID: {logger_process.pid}")
         
-        # Wait for logger to be ready
-        time.sleep(2)
-        logger_health = HealthClient(port=5001)
-        for i in range(10):
-            if logger_health.check() == "SERVING":
-                print("   ✓ Logger service is ready")
-                break
-            time.sleep(1)
-        
-        # Start TTS service
         print("\n3. Starting TTS service...")
-        tts_script = Path('services/tts/tts_service.py').absolute()
-        
-        tts_log = open('test_tts.log', 'w')
-        tts_process = subprocess.Popen(
-            [str(venv_python), str(tts_script)],
-            stdout=tts_log,
-            stderr=subprocess.STDOUT
-        )
+        tts_started = time.monotonic()
+        tts_process = launch('services/tts/tts_service.py')
+        tts_log = follow(tts_process.stdout)  # Last 100 lines, kept in memory for failure reports
         print(f"   TTS started with PID: {tts_process.pid}")
         
-        # Wait for TTS to initialize (model loading)
-        print("\n4. Waiting for TTS model to load...")
+        # Wait for both, TTS initializing (model loading)
+        print("\n4. Waiting for logger and TTS model to load...")
         print("   (This may take a moment on first run as it downloads the Kokoro model)")
+        logger_health = HealthClient(port=5001)
         tts_health = HealthClient(port=5006)
-        
-        for i in range(60):  # Give up to 60 seconds for model download/load
-            status = tts_health.check()
-            if status == "SERVING":
-                print("   ✓ TTS service is ready!")
-                break
-            elif i % 5 == 0:  # Print progress every 5 seconds
-                print(f"   Still loading... ({i}s)")
-            time.sleep(1)
-        else:
-            print("   ✗ TTS service failed to become ready")
-            return False
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            logger_ready = pool.submit(logger_health.wait_for_serving, timeout=12, check_interval=0.05)
+            # Give up to 60 seconds for model download/load
+            tts_ready = pool.submit(tts_health.wait_for_serving, timeout=60, check_interval=0.2)
+            
+            if logger_ready.result():
+                print("   ✓ Logger service is ready")
+            if tts_ready.result():
+                print(f"   ✓ TTS service is ready! ({time.monotonic() - tts_started:.1f}s)")
+            else:
+                print("   ✗ TTS service failed to become ready")
+                return False
         
         # Connect to TTS service
         print("\n5. Connecting to TTS service...")
         channel = grpc.insecure_channel('127.0.0.1:5006')
         stub = services_pb2_grpc.TtsServiceStub(channel)
         
+        if warm:
+            # One synthesis pulls every weight and voice file through the page
+            # cache; a relaunch should then skip the cold read entirely
+            print("\n   Warm pass: one synthesis, then restarting TTS...")
+            stub.Speak(services_pb2.SpeakRequest(text="Warm up.", dialog_id="test_warm", voice="af_heart"))
+            tts_process.terminate()
+            tts_process.wait(timeout=5)
+            
+            tts_started = time.monotonic()
+            tts_process = launch('services/tts/tts_service.py')
+            tts_log = follow(tts_process.stdout)
+            if not tts_health.wait_for_serving(timeout=60, check_interval=0.05):
+                print("   ✗ TTS service failed to come back")
+                return False
+            warm_ready_s = time.monotonic() - tts_started
+            verdict = "within" if warm_ready_s < WARM_READY_BUDGET_S else "over"
+            print(f"   Warm TTS ready in {warm_ready_s:.2f}s ({verdict} the {WARM_READY_BUDGET_S:.1f}s budget)")
+        
         # Synthesize speech
         print("\n6. Synthesizing speech...")
         print(f"   Text: {test_text[:100]}...")
         
-        start_time = time.time()
-        response = stub.Speak(services_pb2.SpeakRequest(
-            text=test_text,
-            dialog_id="test_audio",
-            voice="af_heart"  # Female voice
-        ))
-        synthesis_time = time.time() - start_time
-        
-        if response.success:
-            print(f"   ✓ Synthesis successful!")
-            print(f"   Synthesis time: {synthesis_time:.2f}s")
-            print(f"   Audio duration: {response.duration_ms/1000:.2f}s")
+        with playback_finished(stub, "test_audio") as finished:
+            start_time = time.time()
+            response = stub.Speak(services_pb2.SpeakRequest(
+                text=test_text,
+                dialog_id="test_audio",
+                voice="af_heart"  # Female voice
+            ))
+            synthesis_time = time.time() - start_time
             
-            # Note: The audio is already being played by the TTS service
-            # through its AudioStreamQueue. If you want to save it to file,
-            # you would need to modify the TTS service to return the audio data
-            print("\n7. Audio should be playing through your speakers...")
-            print("   (Make sure your audio output is not muted)")
-            
-            # Wait for playback to complete
-            time.sleep(response.duration_ms/1000 + 1)
-            
-        else:
-            print(f"   ✗ Synthesis failed: {response.message}")
-            return False
+            if response.success:
+                print(f"   ✓ Synthesis successful!")
+                print(f"   Synthesis time: {synthesis_time:.2f}s")
+                print(f"   Audio duration: {response.duration_ms/1000:.2f}s")
+                
+                # Note: The audio is already being played by the TTS service
+                # through its AudioStreamQueue. If you want to save it to file,
+                # you would need to modify the TTS service to return the audio data
+                # TODO: if audio is played or captured here, use sd.RawOutputStream in
+                # callback mode over one preallocated int16 buffer, not sd.play() per clip
+                print("\n7. Audio should be playing through your speakers...")
+                print("   (Make sure your audio output is not muted)")
+                
+                # Wait for playback to complete
+                finished.wait(timeout=response.duration_ms/1000 + 2)
+                
+            else:
+                print(f"   ✗ Synthesis failed: {response.message}")
+                return False
         
         # Test with a different voice (male)
         print("\n8. Testing with male voice...")
-        response = stub.Speak(services_pb2.SpeakRequest(
-            text="This is a test with a male voice. Testing one, two, three.",
-            dialog_id="test_audio_male",
-            voice="am_adam"  # Male voice
-        ))
-        
-        if response.success:
-            print(f"   ✓ Male voice synthesis successful!")
-            time.sleep(response.duration_ms/1000 + 1)
+        with playback_finished(stub, "test_audio_male") as finished:
+            response = stub.Speak(services_pb2.SpeakRequest(
+                text="This is a test with a male voice. Testing one, two, three.",
+                dialog_id="test_audio_male",
+                voice="am_adam"  # Male voice
+            ))
+            
+            if response.success:
+                print(f"   ✓ Male voice synthesis successful!")
+                finished.wait(timeout=response.duration_ms/1000 + 2)
         
         print("\n" + "="*80)
         print("✓ TTS TEST COMPLETED SUCCESSFULLY!")
         print("="*80)
+        passed = True
         return True
         
     except Exception as e:
@@ -152,29 +198,37 @@ def test_tts_with_audio():
         print("\n9. Cleaning up...")
         if tts_process:
             tts_process.terminate()
-            try:
-                tts_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
+            if not wait_pid(tts_process.pid, 2):
                 tts_process.kill()
+                wait_pid(tts_process.pid, 1)
+            tts_process.poll()  # Reap it
             print("   TTS service stopped")
             
         if logger_process:
             logger_process.terminate()
-            try:
-                logger_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
+            if not wait_pid(logger_process.pid, 2):
                 logger_process.kill()
+                wait_pid(logger_process.pid, 1)
+            logger_process.poll()  # Reap it
             print("   Logger service stopped")
         
-        # Show TTS log tail
-        if Path('test_tts.log').exists():
+        # Catch anything the services left behind
+        kill_by_name(_SERVICES_RE)
+        
+        # Show TTS log tail on failure
+        if not passed and tts_log:
             print("\n10. Last TTS log lines:")
-            with open('test_tts.log', 'r') as f:
-                lines = f.readlines()
-                for line in lines[-20:]:
-                    print(f"   {line.rstrip()}")
+            for line in list(tts_log)[-20:]:
+                print(f"   {line.rstrip()}")
 
 
 if __name__ == "__main__":
-    success = test_tts_with_audio()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Test TTS service with audio playback')
+    parser.add_argument('--warm', action='store_true',
+                        help=f'Restart TTS after a first synthesis and report how long it takes to be ready (target {WARM_READY_BUDGET_S:.0f}s)')
+    
+    args = parser.parse_args()
+    success = test_tts_with_audio(warm=args.warm)
     sys.exit(0 if success else 1)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""Fork server that keeps the heavy service imports warm between test runs.
+
+Start it once from the repo root and leave it running:
+
+    .venv/bin/python tests/zygote.py
+
+It imports torch, faster-whisper, Kokoro, grpc and the service modules a
+single time, then forks a child per launch() request, so a service starting
+under test skips the import and bytecode-load part of its cold start. CUDA is
+never touched here; each child still creates its own context when its model
+loads. launch() falls back to a plain subprocess when no zygote is running.
+
+The caller opens the service's output (a log file or a pipe) and launch()
+hands that fd to the zygote over the socket (SCM_RIGHTS), so the service can
+write to a pipe read by the test either way.
+
+The socket lives in the per-user private runtime directory, and both ends
+check the other is running as the same user (SO_PEERCRED). Children keep
+the zygote's own environment, with only FORWARDED_ENV taken from the caller.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import select
+import signal
+import socket
+import struct
+import importlib
+import selectors
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+VENV_PY = ROOT / '.venv/bin/python'
+SERVICES_DIR = ROOT / 'services'
+
+# Caller environment variables a launched service picks up; anything else
+# comes from the zygote's own environment
+FORWARDED_ENV = (
+    'CUDA_VISIBLE_DEVICES',
+    'PYTORCH_CUDA_ALLOC_CONF',
+    'PYTHONUNBUFFERED',
+    'HF_HUB_OFFLINE',
+    'OLLAMA_HOST',
+)
+
+sys.path.insert(0, str(ROOT))
+
+from common.proc_utils import register_cmdline, runtime_dir, unregister_cmdline, wait_pid
+
+# Imported before forking; sounddevice is left out because it starts
+# PortAudio at import, which must happen in the child that plays audio
+PRELOAD = (
+    'numpy',
+    'grpc',
+    'grpc_health.v1.health_pb2',
+    'torch',
+    'faster_whisper',
+    'kokoro',
+    'proto.services_pb2',
+    'proto.services_pb2_grpc',
+    'common.base_service',
+    'common.logger_client',
+)
+
+
+def socket_path():
+    """The zygote's socket, in the private per-user runtime directory."""
+    return os.path.join(runtime_dir(), 'zygote.sock')
+
+
+def _peer_uid(sock):
+    """User id of the process on the other end of a Unix socket."""
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+class ZygoteProcess:
+    """Popen-like handle for a service forked by the zygote.
+
+    The service is the zygote's child, not ours. The zygote keeps the launch
+    connection open and writes the child's exit status to it once it has
+    reaped the child, so liveness never depends on a pid that may be reused.
+    """
+
+    def __init__(self, sock, args):
+        self.args = args
+        self.returncode = None
+        self.stdout = None
+        self._sock = sock
+        self._buf = b''
+        self.pid = json.loads(self._readline())['pid']
+
+    def _readline(self, timeout=None):
+        """Read one line from the zygote; None on timeout, b'' if it hung up."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b'\n' not in self._buf:
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+                if not select.select([self._sock], [], [], remaining)[0]:
+                    return None
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                return b''
+            self._buf += chunk
+        line, _, self._buf = self._buf.partition(b'\n')
+        return line
+
+    def _collect(self, timeout):
+        """Pick up the exit status if the zygote has sent it within timeout."""
+        if self.returncode is not None:
+            return
+        line = self._readline(timeout)
+        if line is None:
+            return
+        if line:
+            self.returncode = json.loads(line)['returncode']
+        else:
+            # The zygote died first; the child was reparented and its status is lost
+            if not wait_pid(self.pid, timeout):
+                return
+            self.returncode = 1
+        self._sock.close()
+
+    def poll(self):
+        self._collect(0)
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self._collect(timeout)
+        if self.returncode is None:
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        # Like Popen, never signal a pid once its exit has been reported
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+def launch(script, log_path=None):
+    """Start a service script with stdout and stderr going to log_path.
+    
+    Args:
+        script: Path to the service script
+        log_path: File that receives the service's output; None sends it to
+            a pipe readable (as text) from the returned handle's stdout
+    
+    Returns:
+        ZygoteProcess when a zygote is running, otherwise a subprocess.Popen
+    """
+    script = str(Path(script).resolve())
+    if log_path is None:
+        read_fd, out_fd = os.pipe()
+        stdout = open(read_fd, 'r', errors='replace')
+    else:
+        out_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        stdout = None
+    # None unsets a variable the zygote has but the caller does not
+    env = {key: os.environ.get(key) for key in FORWARDED_ENV}
+    request = {'script': script, 'cwd': os.getcwd(), 'env': env}
+    
+    try:
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(socket_path())
+                if _peer_uid(sock) != os.getuid():
+                    raise PermissionError("zygote socket is owned by another user")
+                socket.send_fds(sock, [b'\0'], [out_fd])
+                sock.sendall(json.dumps(request).encode() + b'\n')
+                proc = ZygoteProcess(sock, [script])  # Keeps sock for the exit status
+            except BaseException:
+                sock.close()
+                raise
+        except (FileNotFoundError, ConnectionRefusedError, ValueError, KeyError):
+            # Popen already spawns with vfork on Linux (CPython 3.10+) as long as no
+            # preexec_fn is given; close_fds=False also skips the child's fd-table walk,
+            # which is safe since everything we open is non-inheritable (PEP 446)
+            proc = subprocess.Popen(
+                [str(VENV_PY), script],
+                stdout=out_fd,
+                stderr=subprocess.STDOUT,
+                close_fds=False
+            )
+    finally:
+        os.close(out_fd)  # The service holds the only write end now
+    
+    proc.stdout = stdout
+    return proc
+
+
+def _run_child(request, out_fd):
+    """Become the requested service, writing its output to out_fd; never returns."""
+    code = 0
+    try:
+        os.setsid()
+        os.dup2(out_fd, 1)
+        os.dup2(out_fd, 2)
+        os.close(out_fd)
+        os.chdir(request['cwd'])
+        for key, value in request['env'].items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        script = request['script']
+        sys.argv = [script]
+        sys.path[0] = str(Path(script).parent)
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve():
+    """Preload the heavy modules, then fork a service per request."""
+    # Forked children must not inherit gRPC state
+    os.environ.setdefault('GRPC_ENABLE_FORK_SUPPORT', '1')
+
+    start = time.monotonic()
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"[zygote] skipping {name}: {e}")
+    print(f"[zygote] preloaded in {time.monotonic() - start:.1f}s")
+
+    # Only ever unlinks inside our own private directory
+    path = socket_path()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print(f"[zygote] listening on {path}")
+
+    # One loop waits on new launches and on a pidfd per running child; a
+    # child's launch connection stays open until its exit status is sent
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ)
+
+    try:
+        while True:
+            for key, _ in sel.select():
+                if key.fileobj is server:
+                    _start_child(server, sel)
+                else:
+                    _report_exit(sel, key.fd, *key.data)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sel.close()
+        server.close()
+        os.unlink(path)
+
+
+def _start_child(server, sel):
+    """Accept a launch request and fork the service it names."""
+    conn, _ = server.accept()
+    if _peer_uid(conn) != os.getuid():
+        print("[zygote] refused a connection from another user")
+        conn.close()
+        return
+    # The client's output fd comes first, then the request line
+    _, fds, _, _ = socket.recv_fds(conn, 1, 1)
+    if not fds:
+        conn.close()
+        return
+    out_fd = fds[0]
+    try:
+        request = json.loads(conn.makefile('rb').readline())
+        script = Path(request['script']).resolve()
+        env = {key: request['env'][key] for key in FORWARDED_ENV if key in request['env']}
+        if not all(value is None or isinstance(value, str) for value in env.values()):
+            raise TypeError("environment values must be strings")
+        request = {'script': str(script), 'cwd': str(request['cwd']), 'env': env}
+    except (ValueError, KeyError, TypeError):
+        request = None
+    # Only the repo's own service scripts are run
+    if request is None or SERVICES_DIR not in script.parents:
+        print("[zygote] refused a malformed or out-of-tree launch request")
+        os.close(out_fd)
+        conn.close()
+        return
+
+    sys.stdout.flush()  # Or the child repeats our buffered output
+    pid = os.fork()
+    if pid == 0:
+        # Drop every other client's connection and pidfd along with ours
+        for key in list(sel.get_map().values()):
+            if key.fileobj is server:
+                server.close()
+            else:
+                os.close(key.fd)
+                key.data[1].close()
+        sel.close()
+        conn.close()
+        _run_child(request, out_fd)
+    os.close(out_fd)
+    # The child still shows our command line; let kill_by_name find it
+    register_cmdline(pid, f"{VENV_PY} {request['script']}")
+    print(f"[zygote] started {request['script']} (PID: {pid})")
+    try:
+        conn.sendall(json.dumps({'pid': pid}).encode() + b'\n')
+    except OSError:
+        pass  # Client gone; the child is still reaped below
+    sel.register(os.pidfd_open(pid), selectors.EVENT_READ, (pid, conn))
+
+
+def _report_exit(sel, pidfd, pid, conn):
+    """Reap an exited child and send its status to whoever launched it."""
+    sel.unregister(pidfd)
+    os.close(pidfd)
+    _, status = os.waitpid(pid, 0)
+    unregister_cmdline(pid)
+    returncode = os.waitstatus_to_exitcode(status)
+    print(f"[zygote] {pid} exited with {returncode}")
+    try:
+        conn.sendall(json.dumps({'returncode': returncode}).encode() + b'\n')
+    except OSError:
+        pass
+    conn.close()
+
+if __name__ == "__main__":
+    serve()